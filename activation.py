@@ -0,0 +1,149 @@
+"""Online analysis of the potential during the integration:
+ActivationMap: activation and repolarization time of each cell (first
+    crossings of a threshold, interpolated between two updates), computed
+    without storing the potential history.
+Analyzers are attached to an integrator (attach method), updated by its
+time loop, and their results become attributes of the integrator.
+velocity: conduction velocity field of an activation map."""
+
+import numpy
+import itertools
+
+class ActivationMap(object):
+    """Activation and repolarization times.
+        A cell is activated when its potential first crosses the threshold
+        upward, repolarized when it then crosses it downward; the time of
+        the crossing is interpolated linearly between the last two updates.
+        Cells that did not cross are nan."""
+
+    def __init__(self,threshold=-30.0,every=1):
+        """The constructor.
+                threshold : potential (mV)
+                every : updated every this number of steps
+        """
+        self.threshold = threshold
+        self.every = every
+
+    def local(self):
+        """Copy used by an engine of IntPara."""
+        return self
+
+    def start(self,V,t,zeros=numpy.zeros):
+        """Initial potential V at time t, zeros allocates the arrays
+            (shmarray.zeros when they are shared between processes)."""
+        self.act = zeros(V.shape)
+        self.act[...] = numpy.nan
+        self.repol = zeros(V.shape)
+        self.repol[...] = numpy.nan
+        self.prev = zeros(V.shape)
+        self.prev[...] = V
+        self.tprev = t
+
+    def _crossing(self,prev,V,idx,t):
+        """Interpolated times of the crossings of the cells idx."""
+        p = prev[idx]
+        return self.tprev + (t-self.tprev)*(self.threshold-p)/(V[idx]-p)
+
+    def update(self,V,t,sl=Ellipsis):
+        """Potential V at time t; V is the part sl of the grid."""
+        prev = self.prev[sl]
+        act = self.act[sl]
+        repol = self.repol[sl]
+        above = V >= self.threshold
+        was = prev >= self.threshold
+        up = above & ~was & numpy.isnan(act)
+        if up.any():
+            act[up] = self._crossing(prev,V,up,t)
+        down = was & ~above & numpy.isnan(repol) & ~numpy.isnan(act)
+        if down.any():
+            repol[down] = self._crossing(prev,V,down,t)
+        prev[...] = V
+        self.tprev = t
+
+    def finish(self):
+        """End of the time loop of a process."""
+        pass
+
+    def gather(self,other,sl):
+        """Copies the maps of other, computed on the part sl of the grid."""
+        self.act[sl] = other.act
+        self.repol[sl] = other.repol
+
+    def results(self):
+        """Attributes given to the integrator."""
+        return {'activation_map':numpy.array(self.act),
+                'repolarization_map':numpy.array(self.repol)}
+
+    def __repr__(self):
+        return "ActivationMap(threshold=" + str(self.threshold) + " mV)"
+
+def _shifted(T,off,r):
+    """T shifted by off (T of the neighbour off of each cell), nan outside,
+        T being padded by r cells."""
+    sl = tuple([slice(r+o,r+o+n) for o,n in zip(off,T.shape)])
+    return numpy.pad(T,r,mode='constant',constant_values=numpy.nan)[sl]
+
+def _gradient(T,h):
+    """Centered finite differences (one-sided at the borders and next to
+        the cells that did not activate)."""
+    g = []
+    for ax in range(T.ndim):
+        off = [0]*T.ndim
+        off[ax] = 1
+        up = _shifted(T,off,1)
+        off[ax] = -1
+        down = _shifted(T,off,1)
+        d = numpy.where(numpy.isnan(up),T-down,numpy.where(numpy.isnan(down),
+                                                    up-T,(up-down)/2))
+        g.append(d/h[ax])
+    return g
+
+def _lstsq(T,h,radius):
+    """Gradient of the plane fitted to the activation times of the cells
+        within radius (cells) of each cell (least squares)."""
+    nd = T.ndim
+    #normal equations of T(neighbour) = a + sum_k g_k*x_k, for each cell
+    A = numpy.zeros(T.shape+(nd+1,nd+1))
+    b = numpy.zeros(T.shape+(nd+1,))
+    for off in itertools.product(range(-radius,radius+1),repeat=nd):
+        Tn = _shifted(T,off,radius)
+        w = ~numpy.isnan(Tn)
+        Tn = numpy.where(w,Tn,0)
+        phi = [1.0] + [o*hi for o,hi in zip(off,h)]
+        for i in range(nd+1):
+            b[...,i] += w*Tn*phi[i]
+            for j in range(nd+1):
+                A[...,i,j] += w*phi[i]*phi[j]
+    ok = numpy.abs(numpy.linalg.det(A)) > 1e-12*numpy.abs(A).max()
+    A[~ok] = numpy.eye(nd+1)
+    x = numpy.linalg.solve(A,b[...,numpy.newaxis])[...,0]
+    x[~ok] = numpy.nan
+    return [x[...,i+1] for i in range(nd)]
+
+def velocity(act,hx,hy=None,hz=None,method='gradient',radius=1):
+    """Conduction velocity of each cell from its activation time.
+            act : activation map (ms, nan for the cells that did not
+                activate)
+            hx,hy,hz : cell sizes (cm), scalars or fields
+            method : 'gradient' (finite differences) or 'lstsq' (plane
+                fitted on the neighbourhood of each cell)
+            radius : neighbourhood of lstsq (cells)
+        Returns the speed (cm/ms) and the direction (unit vectors, last
+        axis) of the propagation; the velocity is grad(act)/|grad(act)|**2.
+    """
+    act = numpy.asarray(act,float)
+    h = [hx,hy,hz][:act.ndim]
+    assert all([hi is not None for hi in h]), "missing cell sizes"
+    assert method in ('gradient','lstsq'), "unknown method"
+    if method == 'gradient':
+        g = _gradient(act,h)
+    else:
+        h = [numpy.asarray(hi,float) for hi in h]
+        g = _lstsq(act,h,radius)
+    g = numpy.concatenate([numpy.asarray(gi)[...,numpy.newaxis]*
+                                numpy.ones(act.shape+(1,)) for gi in g],-1)
+    norm = numpy.sqrt((g**2).sum(axis=-1))
+    with numpy.errstate(divide='ignore',invalid='ignore'):
+        speed = numpy.where(norm > 0,1/norm,numpy.nan)
+        direction = g/norm[...,numpy.newaxis]
+    return speed,direction
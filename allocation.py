@@ -0,0 +1,133 @@
+"""Memory allocations of the time loop:
+AllocationMeter: bytes (and blocks) allocated per integration step, measured
+    with tracemalloc when the interpreter has it, otherwise with the
+    counters of the C library allocator (glibc mallinfo).
+measure: allocations of a step function.
+steps: allocations of a whole integration loop (compute), per step."""
+
+import ctypes
+import gc
+try:
+    import tracemalloc
+except ImportError:
+    HASTRACEMALLOC = False
+else:
+    HASTRACEMALLOC = True
+
+class _mallinfo(ctypes.Structure):
+    _fields_ = [(n,ctypes.c_int) for n in ('arena','ordblks','smblks','hblks',
+                'hblkhd','usmblks','fsmblks','uordblks','fordblks','keepcost')]
+
+#mallopt parameters (malloc.h)
+M_TRIM_THRESHOLD = -1
+M_MMAP_THRESHOLD = -3
+M_MMAP_MAX = -4
+
+class AllocationMeter(object):
+    """Allocation counters.
+        With tracemalloc, peak is the maximum of the memory allocated during
+        one step and retained the memory still allocated after it (garbage
+        collected), blocks the number of blocks retained.
+        With mallinfo, all the allocations are taken from the heap (no mmap)
+        and the heap is never trimmed while measuring: its growth bounds
+        the temporaries of the steps from above; blocks is not available.
+        The memory mapped by shmarray is not counted by either backend."""
+
+    def __init__(self,backend=None):
+        """The constructor.
+                backend : 'tracemalloc', 'mallinfo' or None (the best
+                    available)
+        """
+        if backend is None:
+            if HASTRACEMALLOC:
+                backend = 'tracemalloc'
+            else:
+                backend = 'mallinfo'
+        assert backend in ('tracemalloc','mallinfo'), "unknown backend"
+        assert backend != 'tracemalloc' or HASTRACEMALLOC, \
+                                        "tracemalloc is not available"
+        self.backend = backend
+        if backend == 'mallinfo':
+            self.libc = ctypes.CDLL(None)
+            assert hasattr(self.libc,'mallinfo'), "mallinfo is not available"
+            self.libc.mallinfo.restype = _mallinfo
+
+    def _used(self):
+        m = self.libc.mallinfo()
+        return (m.uordblks % 2**32) + (m.hblkhd % 2**32)
+
+    def start(self):
+        """Starts counting."""
+        if self.backend == 'tracemalloc':
+            self._was = tracemalloc.is_tracing()
+            if not self._was:
+                tracemalloc.start()
+        else:
+            self.libc.mallopt(M_MMAP_MAX,0)
+            self.libc.mallopt(M_TRIM_THRESHOLD,2**30)
+            self.libc.malloc_trim(0)
+
+    def stop(self):
+        """Stops counting (default allocator settings are restored)."""
+        if self.backend == 'tracemalloc':
+            if not self._was:
+                tracemalloc.stop()
+        else:
+            self.libc.mallopt(M_MMAP_MAX,65536)
+            self.libc.mallopt(M_MMAP_THRESHOLD,128*1024)
+            self.libc.mallopt(M_TRIM_THRESHOLD,128*1024)
+
+    def run(self,f,nsteps):
+        """Calls f nsteps times (counting must be started), returns the
+            counters per step as a dict."""
+        if self.backend == 'tracemalloc':
+            peak = retained = blocks = 0
+            for i in range(nsteps):
+                tracemalloc.clear_traces()
+                f()
+                peak = max(peak,tracemalloc.get_traced_memory()[1])
+                gc.collect()
+                cur = tracemalloc.get_traced_memory()[0]
+                retained += cur
+                blocks += len(tracemalloc.take_snapshot().traces)
+            return {'backend':self.backend,'steps':nsteps,'peak':peak,
+                'retained':float(retained)/nsteps,
+                'blocks':float(blocks)/nsteps}
+        gc.collect()
+        u0 = self._used()
+        h0 = self.libc.mallinfo().uordblks % 2**32
+        for i in range(nsteps):
+            f()
+        gc.collect()
+        u1 = self._used()
+        # heap size minus the heap in use at the start
+        peak = self.libc.mallinfo().arena % 2**32 - h0
+        return {'backend':self.backend,'steps':nsteps,'peak':max(0,peak),
+            'retained':float(u1-u0)/nsteps,'blocks':None}
+
+def measure(f,nsteps=20,warmup=2,backend=None):
+    """Allocations per call of f (one integration step), after warmup
+        calls (caches, first use)."""
+    for i in range(warmup):
+        f()
+    meter = AllocationMeter(backend)
+    meter.start()
+    try:
+        return meter.run(f,nsteps)
+    finally:
+        meter.stop()
+
+def steps(f,nsteps,backend=None):
+    """Allocations of f (a whole loop of nsteps steps, e.g. a compute call),
+        per step for retained and blocks."""
+    meter = AllocationMeter(backend)
+    meter.start()
+    try:
+        d = meter.run(f,1)
+    finally:
+        meter.stop()
+    d['steps'] = nsteps
+    d['retained'] /= nsteps
+    if d['blocks'] is not None:
+        d['blocks'] /= nsteps
+    return d
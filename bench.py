@@ -0,0 +1,164 @@
+"""Benchmarks of the model and integrator hot paths.
+Each case runs in its own process (so that its peak memory can be measured)
+and reports cells x steps per second; results are written as JSON and two
+result files can be compared to flag regressions. The time of import cell_mdl
+(in a new interpreter) is measured as well."""
+
+import cell_mdl
+import numpy
+import multiprocessing as mp
+import resource
+import tempfile
+import shutil
+import platform
+import subprocess
+import json
+import time
+import sys
+import os
+
+#grid sizes of the cases, quick mode uses the first one of each dimension
+SIZES = {1:[(1000,),(20000,)], 2:[(50,50),(200,200)], 3:[(16,16,16),(40,40,40)]}
+
+def usage():
+    print "Usage:"
+    print "Run the benchmarks :\n\t"+sys.argv[0]+" -r results.json [quick]"
+    print "Compare two results :\n\t"+sys.argv[0]+ \
+                                        " -c old.json new.json [tolerance]"
+    print "Optional argument : tolerance, relative slowdown flagged as a"
+    print "                   regression (default 0.1)"
+
+def _model(name,size):
+    """Model of class name with the grid size."""
+    return getattr(cell_mdl,name)(*size)
+
+def _best(f,repeat=3):
+    """Best wall-clock time of repeat calls of f."""
+    best = numpy.inf
+    for i in range(repeat):
+        t0 = time.time()
+        f()
+        best = min(best,time.time()-t0)
+    return best
+
+def bench_derivT(name,size,nsteps=50):
+    mdl = _model(name,size)
+    def f():
+        for i in range(nsteps):
+            mdl.derivT(0.05)
+    return mdl.Y.size/mdl.dim,nsteps,_best(f)
+
+def bench_diff(name,size,nsteps=50):
+    mdl = _model(name,size)
+    diff = getattr(mdl,'diff%dd' % len(size))
+    def f():
+        for i in range(nsteps):
+            diff(mdl.Y[...,0])
+    return mdl.Y.size/mdl.dim,nsteps,_best(f)
+
+def bench_serial(name,size,tmax=5):
+    def f():
+        intg = cell_mdl.IntSerial(_model(name,size))
+        intg.compute(tmax)
+    mdl = _model(name,size)
+    return mdl.Y.size/mdl.dim,int(round(tmax/0.05)),_best(f,1)
+
+def bench_paramp(name,size,tmax=5):
+    mdl = _model(name,size)
+    def f():
+        intg = cell_mdl.IntParaMP(_model(name,size),min(2,mp.cpu_count()))
+        intg.compute(tmax)
+    return mdl.Y.size/mdl.dim,int(round(tmax/0.05)),_best(f,1)
+
+def bench_save(name,size,tmax=20):
+    intg = cell_mdl.IntSerial(_model(name,size))
+    intg.compute(tmax)
+    tmp = tempfile.mkdtemp()
+    try:
+        dt = _best(lambda: intg.save(os.path.join(tmp,'bench')))
+    finally:
+        shutil.rmtree(tmp)
+    return intg.Vm.size/intg.Vm.shape[-1],intg.Vm.shape[-1],dt
+
+def importtime(module='cell_mdl',repeat=5):
+    """Best time of the import of module in a new interpreter."""
+    code = "import time; t = time.time(); import %s; print time.time()-t"
+    here = os.path.dirname(os.path.abspath(__file__))
+    best = numpy.inf
+    for i in range(repeat):
+        out = subprocess.check_output([sys.executable,'-c',code % module],
+                                                                    cwd=here)
+        best = min(best,float(out.split()[-1]))
+    return best
+
+CASES = [('Red3.derivT',bench_derivT,'Red3'),
+         ('Red6.derivT',bench_derivT,'Red6'),
+         ('diff',bench_diff,'Red3'),
+         ('IntSerial.compute',bench_serial,'Red3'),
+         ('IntParaMP.compute',bench_paramp,'Red3'),
+         ('IntGen.save',bench_save,'Red3')]
+
+def _run(f,name,size,queue):
+    """Runs one case in a separate process."""
+    cells,steps,dt = f(name,size)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024.
+    queue.put((cells,steps,dt,peak))
+
+def run(quick=False):
+    """Runs all the cases, returns the results as a dict."""
+    res = {'python':platform.python_version(),'numpy':numpy.__version__,
+                        'machine':platform.node(),'date':time.ctime(),
+                        'cases':{}}
+    dt = importtime()
+    res['cases']['import cell_mdl'] = {'cells':1,'steps':1,'time':dt,
+                                        'rate':1/dt,'peak_MB':0.0}
+    print '%-36s %10.4g s' % ('import cell_mdl',dt)
+    for case,f,name in CASES:
+        for ndim in sorted(SIZES):
+            for size in SIZES[ndim][:1+(not quick)]:
+                key = case+' '+'x'.join([str(n) for n in size])
+                queue = mp.Queue()
+                p = mp.Process(target=_run,args=(f,name,size,queue))
+                p.start()
+                cells,steps,dt,peak = queue.get()
+                p.join()
+                res['cases'][key] = {'cells':cells,'steps':steps,'time':dt,
+                    'rate':cells*steps/dt,'peak_MB':peak}
+                print '%-36s %10.4g cells.steps/s %8.1f MB' % (key,
+                                                    cells*steps/dt,peak)
+    return res
+
+def compare(old,new,tolerance=0.1):
+    """Cases of new slower than old by more than tolerance (relative rate),
+        as a list of (case,old rate,new rate)."""
+    slow = []
+    for key in sorted(new['cases']):
+        if key not in old['cases']:
+            continue
+        r0 = old['cases'][key]['rate']
+        r1 = new['cases'][key]['rate']
+        flag = r1 < r0*(1-tolerance)
+        print '%-36s %10.4g %10.4g %+7.1f %% %s' % (key,r0,r1,
+                                    100*(r1/r0-1),'REGRESSION'*flag)
+        if flag:
+            slow.append((key,r0,r1))
+    return slow
+
+if __name__ == '__main__':
+    if len(sys.argv) >= 3 and sys.argv[1] == '-r':
+        res = run(quick=(len(sys.argv) == 4 and sys.argv[3] == 'quick'))
+        f = open(sys.argv[2],'w')
+        json.dump(res,f,indent=1,sort_keys=True)
+        f.close()
+    elif len(sys.argv) >= 4 and sys.argv[1] == '-c':
+        if len(sys.argv) == 5:
+            tol = float(sys.argv[4])
+        else:
+            tol = 0.1
+        old = json.load(open(sys.argv[2]))
+        new = json.load(open(sys.argv[3]))
+        if compare(old,new,tol):
+            sys.exit(1)
+    else:
+        usage()
+        sys.exit(2)
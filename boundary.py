@@ -0,0 +1,71 @@
+"""Boundary conditions of tissue models:
+Boundary: Neumann (no flux), Dirichlet or periodic conditions, applied by
+    updating one layer of ghost cells on the bordered sides of the grid."""
+
+import numpy
+
+class Boundary(object):
+    """Boundary conditions applied on ghost cells.
+        The ghost cells are the padding cells of the model (one per bordered
+        side); they are refreshed from the interior before each diffusion
+        step and their own Laplacian is cleared, so that interior cells need
+        no mask."""
+
+    kinds = ('neumann','dirichlet','periodic')
+
+    def __init__(self,kind='neumann',value=0.0):
+        """The constructor.
+                kind : 'neumann', 'dirichlet' or 'periodic', or a list with
+                    one kind per axis [X,Y,Z]
+                value : potential imposed by the Dirichlet condition (mV)
+        """
+        if isinstance(kind,str):
+            kind = [kind]*3
+        for k in kind:
+            assert k in self.kinds, "unknown boundary condition: " + str(k)
+        self.kind = list(kind)
+        self.value = value
+        self.sides = [True]*6
+        self.source = None
+
+    def bind(self,borders,source=None):
+        """Copy of the conditions applied on the sides having ghost cells.
+                borders : boolean array [firstX,lastX,firstY,lastY,firstZ,lastZ]
+                source : potentials of the whole grid when Var only holds
+                    rows of it (periodic X ghosts then read the opposite
+                    rows of source)
+        """
+        bc = Boundary(self.kind,self.value)
+        bc.sides = [bool(b) for b in borders] + [False]*(6-len(borders))
+        bc.source = source
+        return bc
+
+    def fill(self,Var):
+        """Updates the ghost cells of Var from the interior cells."""
+        for ax in range(Var.ndim):
+            lo,hi = self.sides[2*ax],self.sides[2*ax+1]
+            if not (lo or hi):
+                continue
+            V = numpy.rollaxis(Var,ax)
+            if self.kind[ax] == 'neumann':
+                if lo: V[0] = V[1]
+                if hi: V[-1] = V[-2]
+            elif self.kind[ax] == 'dirichlet':
+                if lo: V[0] = self.value
+                if hi: V[-1] = self.value
+            elif ax == 0 and self.source is not None:
+                if lo: V[0] = self.source[-2]
+                if hi: V[-1] = self.source[1]
+            else:
+                if lo: V[0] = V[-1-hi]
+                if hi: V[-1] = V[int(lo)]
+
+    def clear(self,Dif):
+        """Cancels the spatial derivative on the ghost cells."""
+        for ax in range(Dif.ndim):
+            V = numpy.rollaxis(Dif,ax)
+            if self.sides[2*ax]: V[0] = 0
+            if self.sides[2*ax+1]: V[-1] = 0
+
+    def __repr__(self):
+        return "Boundary(" + ",".join(self.kind) + ")"
@@ -0,0 +1,267 @@
+"""On-disk cache of simulation results:
+ResultCache: results of IntGen.compute stored under a digest of the complete
+    configuration (model class and parameters, grid, initial state, integrator,
+    arguments of compute with the code of the functions given, and source
+    code), returned as memory maps when the same configuration is computed
+    again. Least recently used entries are evicted above a size limit.
+configkey: digest of a configuration.
+digest: digest of any objects.
+default: cache used by IntGen.computecached."""
+
+import numpy
+import hashlib
+import shutil
+import time
+import types
+import json
+import os
+from functools import partial
+from scipy import sparse
+import recorder
+from warnings import warn
+
+#modules whose source is part of the digest
+CODE = ['cell_mdl','stimulus','recorder','boundary','spectral','conductivity',
+                'shmarray','tissuegraph','timing','cache','schemes','cell0d',
+                'rest']
+#attributes left out of the digest (derived data, counters)
+SKIP = ['cache','timer','stimIdx','flag']
+
+_codeversion = None
+
+def codeversion():
+    """Digest of the source of the modules of CODE (computed once)."""
+    global _codeversion
+    if _codeversion is None:
+        h = hashlib.sha1()
+        here = os.path.dirname(os.path.abspath(__file__))
+        for name in CODE:
+            try:
+                h.update(open(os.path.join(here,name+'.py'),'rb').read())
+            except IOError:
+                h.update(name)
+        _codeversion = h.hexdigest()
+    return _codeversion
+
+def _update(h,obj,seen):
+    """Adds obj to the digest h (recursively for containers and objects)."""
+    if obj is None or isinstance(obj,(bool,int,long,float,complex,str,unicode)):
+        h.update(type(obj).__name__+repr(obj)+';')
+    elif isinstance(obj,numpy.ndarray):
+        h.update('array'+str(obj.dtype)+str(obj.shape)+';')
+        h.update(numpy.ascontiguousarray(obj).view(numpy.uint8))
+    elif isinstance(obj,numpy.generic):
+        _update(h,obj.item(),seen)
+    elif sparse.issparse(obj):
+        obj = obj.tocsr()
+        h.update('sparse'+str(obj.shape)+';')
+        for a in (obj.data,obj.indices,obj.indptr):
+            _update(h,a,seen)
+    elif isinstance(obj,dict):
+        h.update('dict%d;' % len(obj))
+        for k in sorted(obj):
+            if k not in SKIP:
+                _update(h,k,seen)
+                _update(h,obj[k],seen)
+    elif isinstance(obj,(list,tuple)):
+        h.update(type(obj).__name__+'%d;' % len(obj))
+        for o in obj:
+            _update(h,o,seen)
+    elif isinstance(obj,partial):
+        h.update('partial;')
+        for o in (obj.func,obj.args,obj.keywords):
+            _update(h,o,seen)
+    elif isinstance(obj,types.FunctionType):
+        #the code, not only the name: two lambdas share their name
+        h.update(str(obj.__module__)+'.'+obj.__name__+';')
+        _update(h,obj.__code__,seen)
+        _update(h,obj.__defaults__,seen)
+        for c in obj.__closure__ or ():
+            _update(h,c.cell_contents,seen)
+    elif isinstance(obj,types.CodeType):
+        h.update('code'+obj.co_code+';')
+        #the constants hold the code of the nested functions
+        _update(h,obj.co_consts,seen)
+        _update(h,obj.co_names,seen)
+    elif isinstance(obj,(types.BuiltinFunctionType,type)):
+        h.update(str(obj.__module__)+'.'+obj.__name__+';')
+    elif isinstance(obj,types.MethodType):
+        h.update('method '+obj.__name__+';')
+        _update(h,obj.__self__,seen)
+    elif hasattr(obj,'__dict__'):
+        if id(obj) in seen:
+            h.update('seen;')
+            return
+        seen.add(id(obj))
+        h.update(type(obj).__module__+'.'+type(obj).__name__+';')
+        _update(h,obj.__dict__,seen)
+    else:
+        raise TypeError("cannot digest " + type(obj).__name__)
+
+def digest(*objs):
+    """Digest of objs (numbers, strings, arrays, containers, functions and
+        objects by their attributes)."""
+    h = hashlib.sha1()
+    _update(h,objs,set())
+    return h.hexdigest()
+
+def configkey(intg,*args,**kwargs):
+    """Digest of the configuration of intg.compute(*args,**kwargs): classes,
+        parameters and state of the model, integrator settings, arguments
+        and source code."""
+    mdl = intg.mdl
+    h = hashlib.sha1()
+    conf = {'code':codeversion(),
+            'integrator':intg.__class__.__name__,
+            'N':getattr(intg,'N',None),
+            'Iamp':intg.Iamp,
+            'model':mdl.__class__.__name__,
+            'params':mdl.getlistparams(),
+            'Y':mdl.Y,
+            'Yintg':intg.__dict__.get('Y'),
+            'time':mdl.time,
+            'mask':mdl.mask,
+            'stimCoord':mdl.stimCoord,
+            'stimCoord2':mdl.stimCoord2,
+            'args':args,
+            'kwargs':kwargs}
+    _update(h,conf,set())
+    return h.hexdigest()
+
+_default = None
+
+def default():
+    """Cache in ~/.cell_mdl_cache (created on first use)."""
+    global _default
+    if _default is None:
+        _default = ResultCache()
+    return _default
+
+class ResultCache(object):
+    """Results of compute, one directory per configuration.
+        An entry holds Vm and t (written by recorder.savevm, loaded as
+    copy-on-write memory maps of the same kind as the computed Vm) and
+        the state of the model and integrator after compute, so that the
+        following computations continue from the same state. The access time
+        of an entry is its modification time; entries are evicted, least
+        recently used first, when the cache is larger than maxsize."""
+
+    def __init__(self,directory=None,maxsize=2000):
+        """The constructor.
+                directory : location of the cache (~/.cell_mdl_cache if None)
+                maxsize : size limit (MB)
+        """
+        if directory is None:
+            directory = os.path.join(os.path.expanduser('~'),'.cell_mdl_cache')
+        self.directory = directory
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def _path(self,key):
+        return os.path.join(self.directory,key)
+
+    def keys(self):
+        """Keys of the entries, least recently used first."""
+        keys = [k for k in os.listdir(self.directory)
+                                    if os.path.isfile(self._meta(k))]
+        return sorted(keys,key=lambda k: os.path.getmtime(self._path(k)))
+
+    def _meta(self,key):
+        return os.path.join(self._path(key),'meta.json')
+
+    def size(self,key=None):
+        """Size of an entry, or of the whole cache (bytes)."""
+        if key is None:
+            return sum([self.size(k) for k in self.keys()])
+        p = self._path(key)
+        return sum([os.path.getsize(os.path.join(p,f)) for f in os.listdir(p)])
+
+    def invalidate(self,key=None):
+        """Removes an entry (key from configkey, or integrator), or all the
+            entries if key is None."""
+        if key is None:
+            keys = self.keys()
+        elif isinstance(key,str):
+            keys = [key]
+        else:
+            keys = [configkey(key)]
+        for k in keys:
+            shutil.rmtree(self._path(k),ignore_errors=True)
+
+    def clear(self):
+        """Removes all the entries."""
+        self.invalidate()
+
+    def evict(self):
+        """Removes the least recently used entries above maxsize."""
+        keys = self.keys()
+        sizes = [self.size(k) for k in keys]
+        total = sum(sizes)
+        for k,s in zip(keys,sizes):
+            if total <= self.maxsize*2**20:
+                break
+            shutil.rmtree(self._path(k),ignore_errors=True)
+            total -= s
+
+    def _store(self,key,intg):
+        """Writes the results of intg (just computed) under key."""
+        tmp = self._path(key)+'.tmp%d' % os.getpid()
+        os.makedirs(tmp)
+        recorder.savevm(os.path.join(tmp,'vm'),intg.Vm,intg.t)
+        numpy.save(os.path.join(tmp,'Y.npy'),numpy.asarray(intg.mdl.Y))
+        if 'Y' in intg.__dict__:
+            numpy.save(os.path.join(tmp,'Yintg.npy'),numpy.asarray(intg.Y))
+        meta = {'time':float(intg.mdl.time),
+                'stimCoord':list(intg.mdl.stimCoord),
+                'stimCoord2':list(intg.mdl.stimCoord2),
+                'integrator':dict([(a,getattr(intg,a)) for a in ('dt','decim')
+                                                    if a in intg.__dict__]),
+                'created':time.time()}
+        json.dump(meta,open(os.path.join(tmp,'meta.json'),'w'))
+        try:
+            os.rename(tmp,self._path(key))
+        except OSError: #stored meanwhile by another process
+            shutil.rmtree(tmp,ignore_errors=True)
+
+    def _load(self,key,intg,rec=None):
+        """Sets the results of the entry key in intg."""
+        p = self._path(key)
+        meta = json.load(open(self._meta(key)))
+        intg.Vm = recorder.loadvm(os.path.join(p,'vm-Y.npy'),'c')
+        intg.t = numpy.load(os.path.join(p,'vm-t.npy'),mmap_mode='c')
+        intg.mdl.Y[...] = numpy.load(os.path.join(p,'Y.npy'))
+        if 'Y' in intg.__dict__:
+            intg.Y[...] = numpy.load(os.path.join(p,'Yintg.npy'))
+        intg.mdl.time = meta['time']
+        intg.mdl.stimCoord = meta['stimCoord']
+        intg.mdl.stimCoord2 = meta['stimCoord2']
+        intg.__dict__.update(meta['integrator'])
+        intg.recorder = intg._recorder(rec)
+        os.utime(p,None)
+
+    def compute(self,intg,*args,**kwargs):
+        """intg.compute(*args,**kwargs), or its cached results.
+            Returns the key of the entry (None when not cached: online
+            analyzers attached to intg)."""
+        if intg.analyzers:
+            warn('online analyzers are not cached: computing')
+            intg.compute(*args,**kwargs)
+            return None
+        key = configkey(intg,*args,**kwargs)
+        if os.path.isfile(self._meta(key)):
+            self.hits += 1
+            self._load(key,intg,kwargs.get('recorder'))
+        else:
+            self.misses += 1
+            intg.compute(*args,**kwargs)
+            self._store(key,intg)
+            self.evict()
+        return key
+
+    def __repr__(self):
+        return "ResultCache(" + self.directory + ", " + \
+                    str(len(self.keys())) + " entries, " + \
+                    str(self.hits) + " hits, " + str(self.misses) + " misses)"
@@ -0,0 +1,257 @@
+"""Single cell (0D) models integrated by stiff adaptive solvers:
+red3, red6: vectorized right-hand sides of the Red3 and Red6 cell models,
+    for states Y of shape (dim,) or (dim,n) (n cells).
+red3jac, red6jac: their analytic Jacobians, (dim,dim) or (dim,dim,n).
+params: parameters of a model (scalars, or arrays of n values for a batch).
+solve: integration of a batch of cells (initial states and/or parameter
+    sets) with solve_ivp (BDF, Radau, LSODA) when scipy has it, with odeint
+    (LSODA, banded Jacobian) otherwise; dense output in both cases."""
+
+import numpy
+from scipy import integrate, sparse
+from conductivity import value
+
+#parameters used by the right-hand sides
+NAMES = {'Red3':['Gk','Gkca','Gl','Kd','fc','alpha','Kca','El','Ek','Gca2',
+                        'vca2','Rca','Jbase','R','T','F','Ca0','Cm'],
+         'Red6':['Gca','Gk','Gkca','Gl','Kd','fc','alpha','Kca','El','Ek',
+                                                    'R','T','F','Ca0','Cm']}
+
+def params(mdl,**override):
+    """Parameters of the model mdl (Cm averaged if it is a field), override
+        replacing some of them (arrays of n values for a batch of cells)."""
+    p = {}
+    for name in NAMES[mdl.__class__.__name__]:
+        if name == 'Cm':
+            p[name] = float(numpy.mean(value(mdl.Cm)))
+        else:
+            p[name] = mdl.__dict__[name]
+    for name in override:
+        assert name in p, "unknown parameter " + name
+        p[name] = numpy.asarray(override[name],float)
+    return p
+
+def _sig(x):
+    return 1/(1+numpy.exp(x))
+
+def red3(Y,p,Istim=0.0):
+    """Time derivative of the Red3 states Y (Vm,nK,[Ca] along the first
+        axis)."""
+    V,n,Ca = Y
+    c = p['R']*p['T']/(2*p['F'])
+    Eca = c*numpy.log(p['Ca0']/Ca)
+    s = _sig(-(V-p['vca2'])/p['Rca'])
+    hki = _sig((4.2-V)/21.1)
+    tnk = 23.75*numpy.exp(-V/72.15)
+    Ica2 = p['Jbase']-p['Gca2']*(V-Eca)*s
+    Ik = p['Gk']*n*(V-p['Ek'])
+    Ikca = p['Gkca']*Ca**2/(Ca**2+p['Kd']**2)*(V-p['Ek'])
+    Il = p['Gl']*(V-p['El'])
+    return numpy.array([(Istim-Ica2-Ik-Ikca-Il)/p['Cm'],
+                        (hki-n)/tnk,
+                        p['fc']*(-p['alpha']*Ica2-p['Kca']*Ca)])
+
+def red3jac(Y,p,Istim=0.0):
+    """Jacobian of red3, J[i,j] = d(dY[i])/dY[j]."""
+    V,n,Ca = Y
+    c = p['R']*p['T']/(2*p['F'])
+    Eca = c*numpy.log(p['Ca0']/Ca)
+    s = _sig(-(V-p['vca2'])/p['Rca'])
+    hki = _sig((4.2-V)/21.1)
+    tnk = 23.75*numpy.exp(-V/72.15)
+    q = Ca**2/(Ca**2+p['Kd']**2)
+    dIca2_V = -p['Gca2']*(s+(V-Eca)*s*(1-s)/p['Rca'])
+    dIca2_Ca = -p['Gca2']*c/Ca*s
+    dq = 2*Ca*p['Kd']**2/(Ca**2+p['Kd']**2)**2
+    J = numpy.zeros((3,3)+numpy.shape(V))
+    J[0,0] = -(dIca2_V+p['Gk']*n+p['Gkca']*q+p['Gl'])/p['Cm']
+    J[0,1] = -p['Gk']*(V-p['Ek'])/p['Cm']
+    J[0,2] = -(dIca2_Ca+p['Gkca']*dq*(V-p['Ek']))/p['Cm']
+    J[1,0] = hki*(1-hki)/21.1/tnk+(hki-n)/(tnk*72.15)
+    J[1,1] = -1/tnk
+    J[2,0] = -p['fc']*p['alpha']*dIca2_V
+    J[2,2] = p['fc']*(-p['alpha']*dIca2_Ca-p['Kca'])
+    return J
+
+def _th1ca(V):
+    """Time constant of h1ca and its derivative."""
+    a = 24.65*numpy.exp(-0.07281*V)
+    b = 17.64*numpy.exp(0.029*V)
+    out = (V < -10) | (V > 45)
+    return numpy.where(out,a+b,160.),numpy.where(out,-0.07281*a+0.029*b,0.)
+
+def red6(Y,p,Istim=0.0):
+    """Time derivative of the Red6 states Y (Vm,mca,h1ca,h2ca,nK,[Ca] along
+        the first axis)."""
+    V,m,h1,h2,n,Ca = Y
+    c = p['R']*p['T']/(2*p['F'])
+    Eca = c*numpy.log(p['Ca0']/Ca)
+    mcai = _sig((-27-V)/6.6)
+    hcai = _sig((V+34)/5.4)
+    hki = _sig((4.2-V)/21.1)
+    tmca = 0.64*numpy.exp(-0.04*V)+1.188
+    th1ca = _th1ca(V)[0]
+    tnk = 23.75*numpy.exp(-V/72.15)
+    hca = 0.38*h1+0.22*h2+0.06
+    Ica = p['Gca']*m*m*hca/(1+Ca)*(V-Eca)
+    Ik = p['Gk']*n*(V-p['Ek'])
+    Ikca = p['Gkca']*Ca**2/(Ca**2+p['Kd']**2)*(V-p['Ek'])
+    Il = p['Gl']*(V-p['El'])
+    return numpy.array([(Istim-Ica-Ik-Ikca-Il)/p['Cm'],
+                        (mcai-m)/tmca,
+                        (hcai-h1)/th1ca,
+                        (hcai-h2)/160.,
+                        (hki-n)/tnk,
+                        p['fc']*(-p['alpha']*Ica-p['Kca']*Ca)])
+
+def red6jac(Y,p,Istim=0.0):
+    """Jacobian of red6, J[i,j] = d(dY[i])/dY[j]."""
+    V,m,h1,h2,n,Ca = Y
+    c = p['R']*p['T']/(2*p['F'])
+    Eca = c*numpy.log(p['Ca0']/Ca)
+    mcai = _sig((-27-V)/6.6)
+    hcai = _sig((V+34)/5.4)
+    hki = _sig((4.2-V)/21.1)
+    e = numpy.exp(-0.04*V)
+    tmca = 0.64*e+1.188
+    th1ca,dth1ca = _th1ca(V)
+    tnk = 23.75*numpy.exp(-V/72.15)
+    fca = 1/(1+Ca)
+    hca = 0.38*h1+0.22*h2+0.06
+    g = p['Gca']*m*m*hca*fca
+    q = Ca**2/(Ca**2+p['Kd']**2)
+    dq = 2*Ca*p['Kd']**2/(Ca**2+p['Kd']**2)**2
+    dIca = [g,
+            2*p['Gca']*m*hca*fca*(V-Eca),
+            p['Gca']*m*m*0.38*fca*(V-Eca),
+            p['Gca']*m*m*0.22*fca*(V-Eca),
+            0,
+            p['Gca']*m*m*hca*(-fca**2*(V-Eca)+fca*c/Ca)]
+    dhcai = -hcai*(1-hcai)/5.4
+    J = numpy.zeros((6,6)+numpy.shape(V))
+    for j in range(6):
+        J[0,j] = -dIca[j]/p['Cm']
+        J[5,j] = -p['fc']*p['alpha']*dIca[j]
+    J[0,0] -= (p['Gk']*n+p['Gkca']*q+p['Gl'])/p['Cm']
+    J[0,4] -= p['Gk']*(V-p['Ek'])/p['Cm']
+    J[0,5] -= p['Gkca']*dq*(V-p['Ek'])/p['Cm']
+    J[1,0] = mcai*(1-mcai)/6.6/tmca+(mcai-m)*0.0256*e/tmca**2
+    J[1,1] = -1/tmca
+    J[2,0] = dhcai/th1ca-(hcai-h1)*dth1ca/th1ca**2
+    J[2,2] = -1/th1ca
+    J[3,0] = dhcai/160.
+    J[3,3] = -1/160.
+    J[4,0] = hki*(1-hki)/21.1/tnk+(hki-n)/(tnk*72.15)
+    J[4,4] = -1/tnk
+    J[5,5] -= p['fc']*p['Kca']
+    return J
+
+#right-hand side and Jacobian of each model
+RHS = {'Red3':(red3,red3jac),'Red6':(red6,red6jac)}
+
+class Solution(object):
+    """Result of solve: t (nt,), Y (n,dim,nt), and sol(t) the dense output
+        ((n,dim) or (n,dim,len(t)))."""
+
+    def __init__(self,t,Y,sol,nfev,njev):
+        self.t = t
+        self.Y = Y
+        self._sol = sol
+        self.nfev = nfev
+        self.njev = njev
+
+    def sol(self,t):
+        return self._sol(t)
+
+def _hermite(t,y,dy):
+    """Piecewise cubic Hermite interpolant of y (nt,m) with slopes dy."""
+    def sol(tq):
+        tq = numpy.asarray(tq,float)
+        i = numpy.clip(numpy.searchsorted(t,tq)-1,0,len(t)-2)
+        h = (t[i+1]-t[i])[...,numpy.newaxis]
+        s = ((tq-t[i])[...,numpy.newaxis])/h
+        return (2*s**3-3*s**2+1)*y[i]+(s**3-2*s**2+s)*h*dy[i]+ \
+                    (-2*s**3+3*s**2)*y[i+1]+(s**3-s**2)*h*dy[i+1]
+    return sol
+
+def solve(mdl,tmax,Y0=None,wave=None,t_eval=None,method='LSODA',
+                                        rtol=1e-6,atol=1e-8,maxstep=numpy.inf,
+                                        **override):
+    """Integrates a batch of cells of the model mdl (Red3 or Red6).
+            tmax : duration (ms)
+            Y0 : initial states (n,dim), the state of mdl if None
+            wave : stimulation current, function of a time array like the
+                waveforms of stimulus (none if None)
+            t_eval : output times (every ms if None)
+            method : 'LSODA', 'BDF' or 'Radau' (LSODA by odeint if scipy has
+                no solve_ivp)
+            maxstep : largest time step (ms), less than the stimulation
+                length so that it is not stepped over
+            override : parameters replaced, arrays of n values for a batch of
+                parameter sets
+        The n cells form one system whose Jacobian is block diagonal.
+        Returns a Solution."""
+    f,jac = RHS[mdl.__class__.__name__]
+    p = params(mdl,**override)
+    dim = mdl.dim
+    n = max([numpy.size(v) for v in p.values()])
+    if Y0 is None:
+        Y0 = numpy.reshape(mdl.Y,(-1,dim))[:1]
+    Y0 = numpy.array(Y0,float).reshape(-1,dim)
+    if len(Y0) == 1:
+        Y0 = numpy.tile(Y0,(n,1))
+    n = len(Y0)
+    if t_eval is None:
+        t_eval = numpy.arange(0,tmax+1e-9,1.)
+    t_eval = numpy.asarray(t_eval,float)
+    if wave is None:
+        stim = lambda t: 0.0
+    else:
+        stim = lambda t: wave(numpy.array([t]))[0]
+    #cell major state: y[k*dim+i] = Y[k,i]
+    def fun(t,y):
+        return f(y.reshape(n,dim).T,p,stim(t)).T.ravel()
+    nfev = [0,0]
+    def funcount(t,y):
+        nfev[0] += 1
+        return fun(t,y)
+    rows = numpy.arange(n)*dim
+    if hasattr(integrate,'solve_ivp'):
+        ii,jj,kk = numpy.indices((dim,dim,n))
+        def jacs(t,y):
+            nfev[1] += 1
+            J = jac(y.reshape(n,dim).T,p,stim(t))
+            if method == 'LSODA':
+                return sparse.coo_matrix((J.ravel(),(kk.ravel()*dim+ii.ravel(),
+                            kk.ravel()*dim+jj.ravel())),(n*dim,n*dim)).toarray()
+            return sparse.csc_matrix((J.ravel(),(kk.ravel()*dim+ii.ravel(),
+                                kk.ravel()*dim+jj.ravel())),(n*dim,n*dim))
+        r = integrate.solve_ivp(funcount,(0,tmax),Y0.ravel(),method=method,
+                    t_eval=t_eval,dense_output=True,jac=jacs,rtol=rtol,
+                    atol=atol,max_step=maxstep)
+        assert r.success, r.message
+        Y = r.y.reshape(n,dim,-1)
+        sol = lambda tq: r.sol(tq).reshape((n,dim)+numpy.shape(tq))
+        return Solution(r.t,Y,sol,nfev[0],nfev[1])
+    #odeint: banded Jacobian, out[mu+r-c,c] = J[r,c]
+    mu = dim-1
+    def jacb(y,t):
+        nfev[1] += 1
+        J = jac(y.reshape(n,dim).T,p,stim(t))
+        out = numpy.zeros((2*mu+1,n*dim))
+        for i in range(dim):
+            for j in range(dim):
+                out[mu+i-j,rows+j] = J[i,j]
+        return out
+    hmax = 0.0 if numpy.isinf(maxstep) else maxstep
+    y = integrate.odeint(lambda y,t: funcount(t,y),Y0.ravel(),t_eval,
+                        Dfun=jacb,ml=mu,mu=mu,rtol=rtol,atol=atol,hmax=hmax,
+                        mxstep=100000)
+    dy = numpy.array([fun(ti,yi) for ti,yi in zip(t_eval,y)])
+    herm = _hermite(t_eval,y,dy)
+    def sol(tq):
+        v = herm(tq)
+        return numpy.rollaxis(v.reshape(numpy.shape(tq)+(n,dim)),0,3) \
+                if numpy.ndim(tq) else v.reshape(n,dim)
+    return Solution(t_eval,numpy.rollaxis(y.reshape(-1,n,dim),0,3),sol,
+                                                            nfev[0],nfev[1])
@@ -5,51 +5,103 @@ Red6: Uses reduced 6 vars uterine cell model (S.Rihana)."""
 
 import numpy
 from scipy.ndimage.filters import correlate1d
-try:
-    from IPython.parallel import Client
-except ImportError:
-    HASMPI = False
-else:
-    HASMPI = True
 from warnings import warn
-try:
-    from enthought.mayavi import mlab
-except ImportError:
-    HASMAYAVI = False
-else:
-    HASMAYAVI = True
-from scipy.signal import correlate
-import locale
-locale.setlocale(locale.LC_NUMERIC, 'C')
-try:
-    import pylab
-    import matplotlib.cm as cm
-except ImportError:
-    HASMATPLOT = False
-else:
-    HASMATPLOT = True
+from functools import partial
 import multiprocessing as mp
 import shmarray
+import stimulus
+import recorder
+import activation
+import xcorr
+import boundary
+import spectral
+import conductivity
+from conductivity import value
+import timing
+import cache
+import rest
+import schemes
+import cell0d
 #from math import ceil, log
 
+#Optional backends (IPython.parallel, mayavi, pylab) are imported on first
+#use: None means not tried yet, see hasmpi, hasmayavi and hasmatplot
+HASMPI = None
+HASMAYAVI = None
+HASMATPLOT = None
+
+def hasmpi():
+    """Imports IPython.parallel (first call only), returns HASMPI."""
+    global HASMPI,Client
+    if HASMPI is None:
+        try:
+            from IPython.parallel import Client
+        except ImportError:
+            HASMPI = False
+        else:
+            HASMPI = True
+    return HASMPI
+
+def hasmayavi():
+    """Imports mayavi (first call only), returns HASMAYAVI."""
+    global HASMAYAVI,mlab
+    if HASMAYAVI is None:
+        try:
+            from enthought.mayavi import mlab
+        except ImportError:
+            HASMAYAVI = False
+        else:
+            HASMAYAVI = True
+            import locale
+            locale.setlocale(locale.LC_NUMERIC, 'C')
+    return HASMAYAVI
+
+def hasmatplot():
+    """Imports pylab and matplotlib.cm (first call only), returns HASMATPLOT."""
+    global HASMATPLOT,pylab,cm
+    if HASMATPLOT is None:
+        try:
+            import pylab
+            import matplotlib.cm as cm
+        except ImportError:
+            HASMATPLOT = False
+        else:
+            HASMATPLOT = True
+            import locale
+            locale.setlocale(locale.LC_NUMERIC, 'C')
+    return HASMATPLOT
+
 class TissueModel(object):
     """Generic cell and tissue model."""
     def __init__(self, dim, Nx, Ny=0, Nz=0, noise=0.0, 
-                borders=[True,True,True,True,True,True], cylindrical=False):
+                borders=[True,True,True,True,True,True], cylindrical=False,
+                bc=None, graph=None):
         """Model init.
             dim: number of variables of state vector.
             Nx: number of cells along X.
             Ny: number of cells along Y.
             Nz: number of cells along Z.
             noise: noise coefficient for initial state.
-            borders: boolean array [firstX,lastX,firstY,lastY,firstZ,lastZ]"""   
+            borders: boolean array [firstX,lastX,firstY,lastY,firstZ,lastZ]
+            cylindrical: periodic along Y (no Y borders).
+            bc: boundary.Boundary conditions applied on one layer of ghost
+                cells, instead of the damping mask of the padding.
+            graph: tissuegraph.TissueGraph of the cells (Nx, Ny, Nz, borders
+                and bc are then ignored)."""   
         #dimensions
         self.Name = "Generic!"
-        self.Padding = 4
+        if graph is not None:
+            self.Padding = 0
+            bc = None
+        elif bc is None:
+            self.Padding = 4
+        else:
+            self.Padding = 2
         self.time = 0
         self.cyl = cylindrical
+        borders = list(borders)
         if self.cyl:
-            borders[2:5] = [False,False]
+            borders[2:4] = [False,False]
         #Initialise state given the type of model
         self.dim = dim
         if self.dim == 3:
@@ -67,24 +119,30 @@ class TissueModel(object):
         self._hy = 0.03
         self._hz = 0.03
         self.flag = True
+        self.graph = graph
+        self.Vsrc = None
+        self.spec = None
+        self.cond = None
+        self.fiber = None
+        self.Rl = 4500
+        self.Rt = 4500
+        self.atrest = False
+        self.implicit = False
         #state
-        if Nx*Ny*Nz: #3D
+        if graph is not None: #cell graph
+            self.Nx = graph.ncells
+            self.Y = numpy.tile(numpy.array(Y0),(self.Nx,1))
+            self.derivS = self._derivSg
+            self.mask = None
+            self.stimCoord = [0,0]
+            self.stimCoord2 = [0,0]
+        elif Nx*Ny*Nz: #3D
             #update dims with padding
             self.Nx = Nx+borders[0]*self.Padding/2+borders[1]*self.Padding/2
             self.Ny = Ny+borders[2]*self.Padding/2+borders[3]*self.Padding/2
             self.Nz = Nz+borders[4]*self.Padding/2+borders[5]*self.Padding/2
             #generate full state
             self.Y = numpy.tile(numpy.array(Y0),(self.Nx,self.Ny,self.Nz,1))
-            #mask for padding borders  
-            self.mask = 1e-4*numpy.ones(self.Y.shape[0:-1])
-            self.mask[borders[0]*self.Padding/2:
-                self.Nx-borders[1]*self.Padding/2,borders[2]*self.Padding/2:
-                self.Ny-borders[3]*self.Padding/2,borders[4]*self.Padding/2:
-                self.Nz-borders[5]*self.Padding/2] = numpy.ones(
-                (self.Nx-borders[0]*self.Padding/2-borders[1]*self.Padding/2,
-                self.Ny-borders[2]*self.Padding/2-borders[3]*self.Padding/2,
-                self.Nz-borders[4]*self.Padding/2-borders[5]*self.Padding/2)
-                )
             #diffusion coeffs
             self.Dx = 1/(self._Rax*self._Cm*self._hx**2)
             self.Dy = 1/(self._Ray*self._Cm*self._hy**2)
@@ -97,14 +155,6 @@ class TissueModel(object):
             self.Nx = Nx+borders[0]*self.Padding/2+borders[1]*self.Padding/2
             self.Ny = Ny+borders[2]*self.Padding/2+borders[3]*self.Padding/2
             self.Y = numpy.tile(numpy.array(Y0),(self.Nx,self.Ny,1))
-            #mask for padding borders    
-            self.mask = 1e-4*numpy.ones(self.Y.shape[0:-1])
-            self.mask[borders[0]*self.Padding/2:
-                self.Nx-borders[1]*self.Padding/2,borders[2]*self.Padding/2:
-                self.Ny-borders[3]*self.Padding/2] = numpy.ones(
-                (self.Nx-borders[0]*self.Padding/2-borders[1]*self.Padding/2,
-                self.Ny-borders[2]*self.Padding/2-borders[3]*self.Padding/2)
-                )
             #diffusion coeffs
             self.Dx = 1/(self._Rax*self._Cm*self._hx**2)
             self.Dy = 1/(self._Ray*self._Cm*self._hy**2)
@@ -115,12 +165,6 @@ class TissueModel(object):
         elif Nx>1: #1D
             self.Nx = Nx+borders[0]*self.Padding/2+borders[1]*self.Padding/2
             self.Y = numpy.tile(numpy.array(Y0),(self.Nx,1))
-            #mask for padding borders    
-            self.mask = 1e-4*numpy.ones(self.Y.shape[0:-1])
-            self.mask[borders[0]*self.Padding/2:self.Nx-borders[1]*
-                self.Padding/2] = numpy.ones(
-                (self.Nx-borders[0]*self.Padding/2-borders[1]*self.Padding/2)
-                )  
             #diffusion coeffs
             self.Dx = 1/(self._Rax*self._Cm*self._hx**2)
             self.parlist.append('Dx')
@@ -132,14 +176,31 @@ class TissueModel(object):
             self.derivS = self._derivS0
             self.stimCoord = [0,0]
             self.stimCoord2 = [0,0]
+        #mask for padding borders, exact boundary conditions replace it
+        if bc is None:
+            self.bc = None
+            if self.Y.ndim > 1 and graph is None:
+                self.mask = 1e-4*numpy.ones(self.Y.shape[0:-1])
+                self.mask[tuple([slice(borders[2*i]*self.Padding/2,
+                    self.Y.shape[i]-borders[2*i+1]*self.Padding/2)
+                    for i in range(self.Y.ndim-1)])] = 1
+        else:
+            self.bc = bc.bind(borders)
+            self.mask = None
         self.R = 8.314
         self.T = 295
         self.F = 96.487
-        self.Ca0 = 3*numpy.ones(self.Y.shape[0:-1])
+        self.Ca0 = 3.0
         self.Istim = numpy.zeros(self.Y.shape[0:-1])
+        #flat indices of the stimulated cells, uncoupled while self.flag
+        self.stimIdx = numpy.zeros(0,int)
         self.masktempo = 1 
+        #phase counters, set by the integrators
+        self.timer = timing.PhaseTimer()
         self.parlist.extend(['R','T','F','_Cm','_Rax','_Ray','_Raz','_hx','_hy',
-                                                       '_hz','masktempo','cyl'])
+                                                '_hz','masktempo','cyl','bc','graph',
+                                        'spec','cond','fiber','Rl','Rt',
+                                                                'implicit'])
         #option for noisy initial state
         if noise != 0.0:
             self.Y *= 1+(numpy.random.random(self.Y.shape)-.5)*noise 
@@ -153,10 +214,21 @@ class TissueModel(object):
             Y0 = [-50,0.0015709,0.8,0.8,0.079257,0.001]
         else:
             Y0 = numpy.zeros(self.dim)
+        if self.atrest:
+            Y0 = rest.restingstate(self)
         shp = list(self.Y.shape)
         shp[-1] = 1
         self.Y = numpy.tile(numpy.array(Y0),shp)
 
+    def equilibrate(self,on=True):
+        """Starts from (and resets to) the resting state of the current
+            parameters (rest.restingstate, cached per parameter set) instead
+            of the default initial state. Call it before creating the
+            integrator."""
+        self.atrest = on
+        if on:
+            self.Y[...] = rest.restingstate(self)
+
     def copyparams(self,mdl):
         """Retrieves parameters from 'mdl', if it has the same class as self."""
         if self.Name!=mdl.Name:
@@ -165,14 +237,74 @@ class TissueModel(object):
             for par in mdl.parlist:
                 self.__dict__[par]=mdl.__dict__[par]
 
+    def setspectral(self,on=True):
+        """Switches the diffusion along the periodic Y axis of cylindrical
+            models to an exact spectral step after each time step (operator
+            splitting), which removes the explicit stability limit along the
+            circumference."""
+        if on:
+            assert self.cyl and self.Y.ndim > 2 and self.graph is None, \
+                        "spectral diffusion needs a cylindrical 2D or 3D model"
+            assert numpy.ndim(self.Dy) == 0 or \
+                    (self.Dy == numpy.take(self.Dy,[0],axis=1)).all(), \
+                    "spectral diffusion needs Ray, hy and Cm constant along Y"
+            self.spec = spectral.SpectralDiffusion(self.Y.shape[1],1)
+        else:
+            self.spec = None
+        #the stencil leaves out (or takes back) the spectral axis
+        self._updatecond()
+
+    def diffspec(self,dt,Var=None,rows=slice(None)):
+        """Spectral diffusion step along Y of Var (default: Vm, else its
+            rows of the model), stimulated cells are kept uncoupled while
+            self.flag."""
+        if Var is None:
+            Var = self.Y[...,0]
+        if self.flag:
+            Vstim = self.Y[...,0].flat[self.stimIdx]
+        D = self.Dy
+        if numpy.ndim(D) > 0:
+            D = D[rows]
+        self.spec.step(Var,D,dt)
+        if self.flag:
+            self.Y[...,0].flat[self.stimIdx] = Vstim
+
+    def setconductivity(self,on=True):
+        """Switches the diffusion to the variable coefficient stencil built
+            from the (possibly spatially varying) parameters Cm, hx, hy, hz,
+            Rax, Ray, Raz, or from the fiber directions and the resistances
+            Rl and Rt along and across the fibers when self.fiber is set.
+            The stencil is rebuilt when the properties are changed; call
+            setconductivity again after changing fiber, Rl or Rt."""
+        if on:
+            assert self.graph is None and self.Y.ndim > 1, \
+                                "conductivity needs a 1D, 2D or 3D grid model"
+            ndim = self.Y.ndim-1
+            skip = ()
+            if self.spec is not None:
+                skip = (1,)
+            self.cond = conductivity.Conductivity(self.Y.shape[:-1],self._Cm,
+                        [self._hx,self._hy,self._hz][:ndim],
+                        [self._Rax,self._Ray,self._Raz][:ndim],
+                        self.fiber,self.Rl,self.Rt,skip)
+        else:
+            self.cond = None
+
+    def _updatecond(self):
+        """Rebuilds the conductivity stencil if it is used."""
+        if self.__dict__.get('cond') is not None:
+            self.setconductivity()
+
     def _get_hx(self):
         """accessor of hx"""
         return self._hx
     def _set_hx(self,hx):
         """mutator of hx"""
         self._hx = hx
-        try: self.Dx=1/(self._Rax*self._Cm*self._hx**2)
+        try: self.Dx=1/(value(self._Rax)*value(self._Cm)*
+                                                    value(self._hx)**2)
         except ValueError: warn("ValueError! Dx was not changed")
+        self._updatecond()
     hx = property(_get_hx,_set_hx)
 
     def _get_hy(self):
@@ -181,8 +313,10 @@ class TissueModel(object):
     def _set_hy(self,hy):
         """mutator of hy"""
         self._hy = hy
-        try: self.Dy=1/(self._Ray*self._Cm*self._hy**2)
+        try: self.Dy=1/(value(self._Ray)*value(self._Cm)*
+                                                    value(self._hy)**2)
         except ValueError: warn("ValueError! Dy was not changed")
+        self._updatecond()
     hy = property(fget=_get_hy,fset=_set_hy)
 
     def _get_hz(self):
@@ -191,8 +325,10 @@ class TissueModel(object):
     def _set_hz(self,hz):
         """mutator of hz"""
         self._hz = hz
-        try: self.Dz=1/(self._Raz*self._Cm*self._hz**2)
+        try: self.Dz=1/(value(self._Raz)*value(self._Cm)*
+                                                    value(self._hz)**2)
         except ValueError: warn("ValueError! Dz was not changed")
+        self._updatecond()
     hz = property(fget=_get_hz,fset=_set_hz)
 
     def _get_Cm(self):
@@ -201,12 +337,16 @@ class TissueModel(object):
     def _set_Cm(self,Cm):
         """mutator of Cm"""
         self._Cm= Cm 
-        try: self.Dx=1/(self._Rax*self._Cm*self._hx**2)
+        try: self.Dx=1/(value(self._Rax)*value(self._Cm)*
+                                                    value(self._hx)**2)
         except ValueError: warn("ValueError! Dx was not changed")
-        try: self.Dy=1/(self._Ray*self._Cm*self._hy**2)
+        try: self.Dy=1/(value(self._Ray)*value(self._Cm)*
+                                                    value(self._hy)**2)
         except ValueError: warn("ValueError! Dy was not changed")
-        try: self.Dz=1/(self._Raz*self._Cm*self._hz**2)
+        try: self.Dz=1/(value(self._Raz)*value(self._Cm)*
+                                                    value(self._hz)**2)
         except ValueError: warn("ValueError! Dz was not changed")
+        self._updatecond()
     Cm = property(fget=_get_Cm,fset=_set_Cm)
 
     def _get_Rax(self):
@@ -215,8 +355,10 @@ class TissueModel(object):
     def _set_Rax(self,Rax):
         """mutator of Rax"""
         self._Rax = Rax
-        try: self.Dx=1/(self._Rax*self._Cm*self._hx**2)
+        try: self.Dx=1/(value(self._Rax)*value(self._Cm)*
+                                                    value(self._hx)**2)
         except ValueError: warn("ValueError! Dx was not changed")
+        self._updatecond()
     Rax = property(fget=_get_Rax,fset=_set_Rax)
 
     def _get_Ray(self):
@@ -225,8 +367,10 @@ class TissueModel(object):
     def _set_Ray(self,Ray):
         """mutator of Ray"""
         self._Ray = Ray
-        try: self.Dy=1/(self._Ray*self._Cm*self._hy**2)
+        try: self.Dy=1/(value(self._Ray)*value(self._Cm)*
+                                                    value(self._hy)**2)
         except ValueError: warn("ValueError! Dy was not changed")
+        self._updatecond()
     Ray = property(fget=_get_Ray,fset=_set_Ray)
 
     def _get_Raz(self):
@@ -235,8 +379,10 @@ class TissueModel(object):
     def _set_Raz(self,Raz):
         """mutator of Raz"""
         self._Raz = Raz
-        try: self.Dz=1/(self._Raz*self._Cm*self._hz**2)
+        try: self.Dz=1/(value(self._Raz)*value(self._Cm)*
+                                                    value(self._hz)**2)
         except ValueError: warn("ValueError! Dz was not changed")
+        self._updatecond()
     Raz = property(fget=_get_Raz,fset=_set_Raz)
 
 
@@ -252,6 +398,24 @@ class TissueModel(object):
         for par in dictparam:
             self.__dict__[par]=dictparam[par]
 
+    def restrictparams(self,sl):
+        """Restricts the spatially varying parameters (arrays and
+            ParamFields of parlist, given on the whole grid) to the cells sl
+            of a subdomain, then derives Dx, Dy, Dz and the conductivity
+            stencil once from the restricted fields (engine processes)."""
+        cond = self.cond
+        self.cond = None
+        for par in self.parlist:
+            v = self.__dict__.get(par)
+            if par in ('Dx','Dy','Dz'):
+                continue
+            if isinstance(v,conductivity.ParamField) or \
+                            (isinstance(v,numpy.ndarray) and v.ndim > 0):
+                self.__dict__[par] = v[sl]
+        self.Cm = self._Cm
+        if cond is not None:
+            self.setconductivity()
+
     def savedict(self):
         d = self.__dict__.copy()
         d['derivS'] = self.derivS.__repr__()
@@ -265,35 +429,107 @@ class TissueModel(object):
     def _derivative2(self,inumpyut,axis,output=None, mode="wrap",cval=0.0):
         """Computes spatial derivative to get propagation."""
         return correlate1d(inumpyut, [1, -2, 1], axis, output, mode, cval, 0)
+    def _bound(self,Dif):
+        """Applies the borders: mask multiply, or cancels the derivative on
+            the ghost cells if the model has boundary conditions."""
+        if self.bc is None:
+            return Dif*self.mask
+        self.bc.clear(Dif)
+        return Dif
     def diff1d(self,Var):
         """Computes spatial derivative to get propagation."""
-        Dif=self.Dx*self._derivative2(Var,0)
+        if self.bc is not None:
+            self.bc.fill(Var)
+        if self.cond is None:
+            Dif=self.Dx*self._derivative2(Var,0)
+        else:
+            Dif=self.cond.diff(Var)
         if self.flag:
-            Dif[self.stimCoord[0]:self.stimCoord[1]]=0
-            Dif[self.stimCoord2[0]:self.stimCoord2[1]]=0
-        return Dif*self.mask   
+            Dif.flat[self.stimIdx]=0
+        return self._bound(Dif)
     def diff2d(self,Var):
         """Computes spatial derivative to get propagation."""
-        Dif=self.Dx*self._derivative2(Var,0) + self.Dy*self._derivative2(Var,1)
-            
+        if self.bc is not None:
+            self.bc.fill(Var)
+        if self.cond is not None:
+            Dif=self.cond.diff(Var)
+        else:
+            Dif=self.Dx*self._derivative2(Var,0)
+            if self.spec is None:
+                Dif+=self.Dy*self._derivative2(Var,1)
         if self.flag:
-            Dif[self.stimCoord[0]:self.stimCoord[1],self.stimCoord[2]:
-                                                            self.stimCoord[3]]=0
-            Dif[self.stimCoord2[0]:self.stimCoord2[1],self.stimCoord2[2]:
-                                                           self.stimCoord2[3]]=0
-        return Dif*self.mask
+            Dif.flat[self.stimIdx]=0
+        return self._bound(Dif)
     def diff3d(self,Var):
         """Computes spatial derivative to get propagation."""
-        derivx = self.Dx * self._derivative2(Var,0)
-        derivy = self.Dy * self._derivative2(Var,1)
-        derivz = self.Dz * self._derivative2(Var,2)
-        Dif = derivx + derivy + derivz
+        if self.bc is not None:
+            self.bc.fill(Var)
+        if self.cond is not None:
+            Dif = self.cond.diff(Var)
+        else:
+            derivx = self.Dx * self._derivative2(Var,0)
+            derivz = self.Dz * self._derivative2(Var,2)
+            if self.spec is None:
+                derivy = self.Dy * self._derivative2(Var,1)
+                Dif = derivx + derivy + derivz
+            else:
+                Dif = derivx + derivz
+        if self.flag:
+            Dif.flat[self.stimIdx]=0
+        return self._bound(Dif)
+    def diffg(self,Var):
+        """Computes diffusion on the cell graph."""
+        Dif=self.graph.L.dot(Var)/value(self.Cm)
         if self.flag:
-            Dif[self.stimCoord[0]:self.stimCoord[1],self.stimCoord[2]:
-                        self.stimCoord[3],self.stimCoord[4]:self.stimCoord[5]]=0
-            Dif[self.stimCoord2[0]:self.stimCoord2[1],self.stimCoord2[2]:
-                    self.stimCoord2[3],self.stimCoord2[4]:self.stimCoord2[5]]=0
-        return Dif*self.mask    
+            Dif[self.stimIdx]=0
+        return Dif
+    def rhs(self):
+        """Computes the time derivative dY of the state Y: diffusion of the
+            potential only, the models redefine it to add the ionic currents."""
+        t=self.timer.tic()
+        self.dY[...] = 0
+        self.derivS()
+        self.timer.toc('diffusion',t)
+
+    def setimplicit(self,on=True):
+        """Switches the linearly implicit update of the ionic part on or off:
+            derivT then replaces dY by (I-dt*J)^-1.dY, J being the analytic
+            Jacobian of the ionic currents of each cell (cell0d), so the
+            Euler step of the integrators becomes a Rosenbrock-Euler step,
+            stable for large steps of the stiff ionic terms (the diffusion
+            stays explicit)."""
+        self.implicit = on
+
+    def _implicit(self,dt):
+        """dY = (I-dt*J)^-1.dY, the small systems of all the cells solved at
+            once."""
+        p = cell0d.params(self)
+        p['Cm'] = value(self.Cm)
+        J = cell0d.RHS[self.__class__.__name__][1](numpy.rollaxis(self.Y,-1),p)
+        J *= -dt*numpy.asarray(self.masktempo)
+        A = numpy.rollaxis(numpy.rollaxis(J,0,J.ndim),0,J.ndim)
+        i = numpy.arange(self.dim)
+        A[...,i,i] += 1
+        self.dY[...] = numpy.linalg.solve(A,self.dY[...,numpy.newaxis])[...,0]
+
+    def derivT(self,dt,MP=False):
+        """Computes the time derivative and the explicit Euler step of dt
+            (linearly implicit for the ionic part if setimplicit).
+            MP : the integrator updates the (shared) state itself."""
+        self.rhs()
+        if self.implicit:
+            t=self.timer.tic()
+            self._implicit(dt)
+            self.timer.toc('ionic',t)
+        # if the integrator uses shared memory, we don't allocate Y here
+        if not(MP):
+            t=self.timer.tic()
+            self.Y+=self.dY*dt
+            t=self.timer.toc('ionic',t)
+            if self.spec is not None:
+                self.diffspec(dt)
+                self.timer.toc('diffusion',t)
+
     def _derivS0(self):
         """Computes spatial derivative to get propagation. (0D)"""
         pass
@@ -306,13 +542,23 @@ class TissueModel(object):
     def _derivS3(self):
         """Computes spatial derivative to get propagation. (3D)"""
         self.dY[...,0]+=self.diff3d(self.Y[...,0])    
+    def _derivSg(self):
+        """Computes spatial derivative to get propagation. (cell graph)
+            Vsrc holds the potentials of all the cells when the model only
+            computes a block of the graph."""
+        if self.Vsrc is None:
+            self.dY[...,0]+=self.diffg(self.Y[...,0])
+        else:
+            self.dY[...,0]+=self.diffg(self.Vsrc)
     def plotstate(self):
         """Plot state of the model with the suitable method, according its 
             dimensions."""
         if self.Y.ndim==1:
             print "State: Vm={0} mV, nK={1} and [Ca]={2} mmol.".format(
                                                 self.Y[0],self.Y[1],self.Y[2])
-        elif self.Y.ndim==2:
+            return
+        assert hasmatplot(), "Sorry, you have to have pylab installed!"
+        if self.Y.ndim==2:
             #pylab.figure()
             pylab.plot(self.Y)
             pylab.legend( ('Vm','nK','[Ca]'))
@@ -340,12 +586,14 @@ class TissueModel(object):
 class Red3(TissueModel):
     """Cellular and tissular model Red3"""
     def __init__(self,Nx,Ny=0,Nz=0,noise=0.0,
-                     borders=[True,True,True,True,True,True],cylindrical=False):
+            borders=[True,True,True,True,True,True],cylindrical=False,bc=None,
+            graph=None):
         """Model init."""
         self.parlist=['Gk','Gkca','Gl','Kd','fc','alpha','Kca','El','Ek','Gca2',
                                                     'vca2','Rca','Jbase','Name']
         #Generic elements
-        TissueModel.__init__(self,3,Nx,Ny,Nz,noise,borders,cylindrical)
+        TissueModel.__init__(self,3,Nx,Ny,Nz,noise,borders,cylindrical,bc,
+                                                                        graph)
         #Default Parameters
         self.Name="Red3"
         self.Gk=0.064
@@ -365,8 +613,9 @@ class Red3(TissueModel):
         #self.Istim[5:20,5]=0.2
         
 
-    def derivT(self,dt,MP=False):
-        """Computes temporal derivative for red3 model."""
+    def rhs(self):
+        """Computes the time derivative dY of the state Y (red3 model)."""
+        t=self.timer.tic()
         #Variables
         Vm=self.Y[...,0]
         nk=self.Y[...,1]
@@ -384,25 +633,25 @@ class Red3(TissueModel):
         Ikca=self.Gkca*Ca**2/(Ca**2+self.Kd**2)*(Vm-self.Ek)
         Il=self.Gl*(Vm-self.El)        
         #Derivees
-        self.dY[...,0] = (self.Istim - Ica2 -Ik - Ikca -Il)/self.Cm
+        self.dY[...,0] = (self.Istim - Ica2 -Ik - Ikca -Il)/value(self.Cm)
         self.dY[...,1] = (hki-nk)/tnk
         self.dY[...,2] = self.fc*(-self.alpha*Ica2 - self.Kca*Ca)
         self.dY *= self.masktempo
-        #update Y
+        t=self.timer.toc('ionic',t)
         self.derivS()
-        # if the integrator uses shared memory, we don't allocate Y here
-        if not(MP):    
-            self.Y+=self.dY*dt
+        self.timer.toc('diffusion',t)
 
 class Red6(TissueModel):
     """Cellular and tissular model Red6"""
     def __init__(self,Nx,Ny=0,Nz=0,noise=0.0,
-                borders=[True,True,True,True,True,True],cylindrical=False):
+            borders=[True,True,True,True,True,True],cylindrical=False,bc=None,
+            graph=None):
         """Model init."""
         self.parlist=['Gca','Gk','Gkca','Gl','Kd','fc','alpha','Kca','El','Ek',
                                                                         'Name']
         #Generic elements
-        TissueModel.__init__(self,6,Nx,Ny,Nz,noise,borders,cylindrical)
+        TissueModel.__init__(self,6,Nx,Ny,Nz,noise,borders,cylindrical,bc,
+                                                                        graph)
         #Default Parameters
         self.Name="Red6"
         self.Gca=0.09
@@ -419,8 +668,9 @@ class Red6(TissueModel):
         #self.Istim[5:20,5]=0.2
         
 
-    def derivT(self,dt,MP=False):
-        """Computes temporal derivative for red3 model."""
+    def rhs(self):
+        """Computes the time derivative dY of the state Y (red6 model)."""
+        t=self.timer.tic()
         #Variables
         Vm=self.Y[...,0]
         mca=self.Y[...,1]
@@ -457,17 +707,16 @@ class Red6(TissueModel):
         Il=self.Gl*(Vm-self.El)
             
         #Derivees
-        self.dY[...,0] = (self.Istim - Ica -Ik - Ikca -Il)/self.Cm
+        self.dY[...,0] = (self.Istim - Ica -Ik - Ikca -Il)/value(self.Cm)
         self.dY[...,1] = (mcai-mca)/tmca
         self.dY[...,2] = (hcai-h1ca)/th1ca
         self.dY[...,3] = (hcai-h2ca)/th2ca
         self.dY[...,4] = (hki-nk)/tnk
         self.dY[...,5] = self.fc*(-self.alpha*Ica - self.Kca*Ca)
-        #update Y
         self.dY *= self.masktempo
+        t=self.timer.toc('ionic',t)
         self.derivS()
-        if not(MP):
-            self.Y+=self.dY*dt
+        self.timer.toc('diffusion',t)
 
 def profilepara(*args):
     """Function calling the engine process function and profiling it"""
@@ -476,9 +725,14 @@ def profilepara(*args):
     runctx("parallelcompMP(*args)", globals(), locals(), 
                                         filename=('Process-'+str(rank)+'.prof'))
 
-def parallelcompMP(rank,tmax,Nx,Ny,Nz,N,stimCoord,stimCoord2,listparam,Iamp,
-                                    dt,Y,mask,count,Vm,time,mutex,att):
-    """Function used by the engine processes"""
+def parallelcompMP(rank,tmax,Nx,Ny,Nz,N,protocol,listparam,dt,Y,mask,count,Vm,
+                            time,mutex,att,prof=None,rec=None,analyzers=()):
+    """Function used by the engine processes
+        prof: shared array receiving the phase counters of each process (the
+            timing is off if None)
+        rec: recorder.Recorder bound to the whole grid (whole field if None)
+        analyzers: online analyzers (shared arrays), each process updates
+            its own rows"""
 
     try:
         from progressbar import Bar,ProgressBar,Percentage
@@ -510,22 +764,8 @@ def parallelcompMP(rank,tmax,Nx,Ny,Nz,N,stimCoord,stimCoord2,listparam,Iamp,
 #     Which rows should I compute?
     [x,newNx] = findlimitsx(rank,N,Nx)
 
-#     Stimulation (global coordinates)
-    xyIstim1 = stimCoord 
-    xyIstim2 = stimCoord2
-
-#     computing the local coordinates
-    if (xyIstim1[0] > x[-1]) or (xyIstim1[1] < x[0]):
-        xyIstim1[0:2] = [-1,-1]
-    else:
-        xyIstim1[0:2] = [max(xyIstim1[0],x[0])-x[0],
-                           min(xyIstim1[1],x[-1])-x[0]]
-
-    if (xyIstim2[0] > x[-1]) or (xyIstim2[1] < x[0]):
-        xyIstim2[0:2] = [-1,-1]
-    else:
-        xyIstim2[0:2] = [max(xyIstim2[0],x[0])-x[0],
-                           min(xyIstim2[1],x[-1])-x[0]]
+#     Stimulation (local coordinates)
+    protocol = protocol.local([x])
 
 #     Creation of the model (one for each process)
     bdrs=[False] * (2 + bool(Ny)*2 + bool(Nz)*2)
@@ -537,83 +777,64 @@ def parallelcompMP(rank,tmax,Nx,Ny,Nz,N,stimCoord,stimCoord2,listparam,Iamp,
     mdl.Name += 'p'
 
     mdl.Y = Y[x[0]:x[1],...]
-    mdl.mask = mask[x[0]:x[1],...]
-
-    if rank == 0:
-        mdl.mask[-1,...] = 0
-    if rank == N - 1:
-        mdl.mask[0,...] = 0
+    if mdl.graph is not None:
+        # rows x[0]:x[1] of the graph, reading the potentials of all the cells
+        mdl.graph = mdl.graph.rows(x[0],x[1])
+        mdl.Vsrc = Y[...,0]
+        mdl.derivS = mdl._derivSg
+    elif mdl.bc is None:
+        mdl.mask = mask[x[0]:x[1],...]
+
+        if rank == 0:
+            mdl.mask[-1,...] = 0
+        if rank == N - 1:
+            mdl.mask[0,...] = 0
+    else:
+        # only the first and last processes hold X ghost cells, periodic
+        # ones read the opposite rows of the shared potential
+        sides = list(mdl.bc.sides)
+        sides[0] = sides[0] and rank == 0
+        sides[1] = sides[1] and rank == N - 1
+        mdl.bc = mdl.bc.bind(sides,Y[...,0])
 #    else:
 #        mdl.masktempo[-2:,...] = 0
 #    
 #    mdl.masktempo = numpy.ones(mdl.dY.shape[:-1]) + mdl.masktempo
     
 
-    def modify(var,x):
-        if not(isinstance(var,int)) and not(isinstance(var,float)):
-            return var[x[0]:x[1],...]
-        else:
-            return var
-
-    mdl.masktempo = modify(mdl.masktempo,x)
-    mdl.hx = modify(mdl.hx,x)
-    mdl.hy = modify(mdl.hy,x)
-    mdl.hz = modify(mdl.hz,x)
-    mdl.Rax = modify(mdl.Rax,x)
-    mdl.Ray = modify(mdl.Ray,x)
-    mdl.Raz = modify(mdl.Raz,x)
+    mdl.restrictparams((slice(x[0],x[1]),))
 
 #     Tells the model where the stimuli are
-    if xyIstim1[0] != -1:
-        mdl.stimCoord = xyIstim1
-    if xyIstim2[0] != -1:
-        mdl.stimCoord2 = xyIstim2
-
-    def _stim1(mdl,stimCoord,Ist):
-        if stimCoord[0] != -1:
-            mdl.Istim[stimCoord[0]:stimCoord[1]]=Ist
-
-    def _stim2(mdl,stimCoord,Ist):
-        if stimCoord[0] != -1 and stimCoord[2] != -1:
-            mdl.Istim[stimCoord[0]:stimCoord[1],stimCoord[2]:stimCoord[3]]=Ist
-
-    def _stim3(mdl,stimCoord,Ist):
-        if stimCoord[0] != -1 and stimCoord[2] != -1:
-            mdl.Istim[stimCoord[0]:stimCoord[1],stimCoord[2]:stimCoord[3],
-                                       stimCoord[4]:stimCoord[5]]=Ist
+    mdl.stimIdx = protocol.index
 
     decim=20
     NbIter=0
+    k=0
 #    Ft = 0.15
 
-    if Nx*Ny*Nz:
-        stim = _stim3
-    elif Nx*Ny:
-        stim = _stim2
-    elif Nx:
-        stim = _stim1
-    
     test = [rank != 0,rank != N-1]
     if (rank==0) and showbar:
         pbar = ProgressBar(widgets=[Percentage(), Bar()],
                             maxval=len(time)).start()
 
     lx = mdl.dY.shape[0]
+    rows = slice(x[0]+test[0],x[1]-test[1])
+    if rec is None:
+        rec = recorder.Recorder().bind(Y.shape[:-1])
 
     mdl.flag = True
+    timer = timing.PhaseTimer(prof is not None)
+    mdl.timer = timer
 
     while (mdl.time<tmax):
-        Ist=Iamp/2*(numpy.sign(numpy.sin(2*numpy.pi*mdl.time/(2*tmax)))+1)*   \
-                   numpy.sin(2*numpy.pi*mdl.time/(2*tmax))
-
-        if mdl.flag and (mdl.time != 0) and (Ist == 0):
-            mdl.flag = False
-
-        stim(mdl,xyIstim1,Ist)
-        stim(mdl,xyIstim2,Ist)
+        t0 = timer.tic()
+        mdl.flag = protocol.apply(mdl.Istim,k)
+        k+=1
+        timer.toc('stimulus',t0)
 
         mdl.derivT(dt,True)
 
+        t0 = timer.tic()
         if (not round(mdl.time/dt)%decim):
             if not mutex.acquire(timeout=2):
                 print('timeout mutex')
@@ -627,20 +848,37 @@ def parallelcompMP(rank,tmax,Nx,Ny,Nz,N,stimCoord,stimCoord2,listparam,Iamp,
                 mutex.release()
                 if not att.acquire(timeout=2):
                     print('timeout att')
+        t0 = timer.toc('sync',t0)
 
         Y[x[0]+test[0]:x[1]-test[1],...] += mdl.dY[0+test[0]:lx-test[1],...]*dt
+        t0 = timer.toc('ionic',t0)
+        if mdl.spec is not None:
+            mdl.diffspec(dt,Y[x[0]+test[0]:x[1]-test[1],...,0],
+                                                    slice(test[0],lx-test[1]))
+            t0 = timer.toc('diffusion',t0)
 
         mdl.time +=dt
+        for a in analyzers:
+            if not k%a.every:
+                a.update(Y[rows,...,0],mdl.time,rows)
         
         if (rank == 0) and (not round(mdl.time/dt)%decim):
             NbIter+=1
             time[NbIter]=mdl.time
-            Vm[...,NbIter] = Y[...,0]           
+            rec.record(Y,Vm,NbIter)
             if showbar:
                 pbar.update(mdl.time)
+            timer.toc('record',t0)
 
     if (rank == 0) and showbar:    
         pbar.finish()
+    for a in analyzers:
+        a.finish()
+
+    if prof is not None:
+        timer.steps = k
+        nv = len(timer.phases)+1
+        prof[rank*nv:(rank+1)*nv] = timer.tovector()
 
 
 
@@ -653,6 +891,49 @@ class IntGen():
         """
         self.mdl = mdl
         self.Iamp=0.2
+        self.timer = timing.PhaseTimer()
+        self.analyzers = []
+
+    def attach(self,analyzer):
+        """Attaches an online analyzer (e.g. activation.ActivationMap),
+            updated during compute; its results become attributes of the
+            integrator (e.g. activation_map)."""
+        self.analyzers.append(analyzer)
+        return analyzer
+
+    def _startanalyzers(self,V,t,zeros=numpy.zeros):
+        """Initial potential of the analyzers."""
+        for a in self.analyzers:
+            a.start(V,t,zeros)
+
+    def _stopanalyzers(self):
+        """Stores the results of the analyzers."""
+        for a in self.analyzers:
+            self.__dict__.update(a.results())
+
+    def instrument(self,on=True):
+        """Switches the per-phase timing of compute on or off (see report)."""
+        self.timer = timing.PhaseTimer(on)
+
+    def _starttimer(self):
+        """Resets the phase counters before compute."""
+        self.timer.reset()
+        self.timer.cells = self.mdl.Y.size/self.mdl.Y.shape[-1]
+        self.mdl.timer = self.timer
+        return timing.clock()
+
+    def _stoptimer(self,twall):
+        """Stores the phase counters of compute in self.timing."""
+        self.timer.wall = timing.clock()-twall
+        self.mdl.timer = timing.PhaseTimer()
+        self.timing = self.timer.summary()
+
+    def report(self):
+        """Per-phase timing of the last compute (and save), needs
+            instrument() to be called before compute."""
+        assert 'timing' in self.__dict__,"""We could not find the timing. 
+                            Have you tried running "compute" method before?"""
+        return timing.report(self.timing)
         
     def savemodel(self,filename):
         d = self.__dict__.copy()
@@ -669,53 +950,38 @@ class IntGen():
 
     def save(self,filename,limitsize=500,tmax=1000):
         """save t and Vm using the method numpy.savez"""
-        count = 1
+        tio = self.timer.tic()
 #        nmax = round(tmax * self.dt)
-        t_tmp = self.t
+        t_tmp = numpy.asarray(self.t)
         v_tmp = self.Vm
 
         if v_tmp.nbytes / (2**20) > limitsize:
-            toobig = True
-            while toobig:
-                while t_tmp[-1] > tmax*count:
-                    ind = t_tmp.searchsorted(tmax*count)
-                    if v_tmp[...,:ind].nbytes / (2**20) > limitsize:
-                        break
-                    else:
-                        toobig = False
-                    logY=open(filename+'-'+str(count)+'-t.npy','w')
-                    numpy.save(logY,t_tmp[:ind])
-                    logY=open(filename+'-'+str(count)+'-Y.npy','w')
-                    numpy.save(logY,v_tmp[...,:ind])
-                    logY.close()
-                    t_tmp = t_tmp[ind:]
-                    v_tmp = v_tmp[...,ind:]
-                    count += 1
-                if len(t_tmp) > 0:
-                    if v_tmp.nbytes / (2**20) > limitsize:
-                        break
-                    else:
-                        toobig = False
-                        logY=open(filename+'-'+str(count)+'-t.npy','w')
-                        numpy.save(logY,t_tmp)
-                        logY=open(filename+'-'+str(count)+'-Y.npy','w')
-                        numpy.save(logY,v_tmp)
-                        logY.close()
-                if toobig:
-                    warn('the file is too big: tmax is divided by 2')
-                    tmax /= 2
+            # parts of tmax ms (tmax halved until each part fits), of the
+            # same kind as Vm (quantized integers with their scale and
+            # offset, adaptive stored frames with their numbers)
+            while True:
+                ind = numpy.unique(numpy.r_[0,t_tmp.searchsorted(
+                        numpy.arange(tmax,t_tmp[-1],tmax)),len(t_tmp)])
+                parts = zip(ind[:-1],ind[1:])
+                size = max([recorder.window(v_tmp,a,b).nbytes
+                                                        for a,b in parts])
+                if size / (2**20) <= limitsize or len(parts) == len(t_tmp):
+                    break
+                warn('the file is too big: tmax is divided by 2')
+                tmax /= 2.
+            for count,(a,b) in enumerate(parts):
+                recorder.savevm(filename+'-'+str(count+1),
+                                        recorder.window(v_tmp,a,b),t_tmp[a:b])
         else:
-            logY = open(filename+'-t.npy','w')
-            numpy.save(logY,t_tmp)
-            logY = open(filename+'-Y.npy','w')
-            numpy.save(logY,v_tmp)
-            logY.close()
+            recorder.savevm(filename,self.Vm,self.t)
 
 
 
         f = open(filename+'.txt','w')
         f.write('Integrator : ' + self.__class__.__name__ +' \n')
-        if not('Nz' in self.mdl.__dict__):
+        if self.mdl.graph is not None:
+            f.write('Dimension : ' + str(self.mdl.Nx) + ' cells (graph) \n')
+        elif not('Nz' in self.mdl.__dict__):
             if not ('Ny' in self.mdl.__dict__):
                 f.write('Dimension : ' + str(self.mdl.Nx) + ' (1D) \n')
             else:
@@ -727,37 +993,77 @@ class IntGen():
         f.write('Duration : ' + str(max(self.t)) + 'ms \n')
         f.write('Coordinates of the stimulation :' + str(self.mdl.stimCoord) +
                                      ' and ' + str(self.mdl.stimCoord2) +' \n')
+        if 'recorder' in self.__dict__:
+            f.write('Recording : ' + repr(self.recorder) + '\n')
         f.write('Model : ' + self.mdl.Name +'\n')
         f.write('\t parameters of this models : \n')
         for par in self.mdl.parlist:
             f.write('\t\t ' + str(par) + ' : ' + str(self.mdl.__dict__[par]) + 
                                                                         '\n')
         f.close()
+        self.timer.toc('io',tio)
+        if 'timing' in self.__dict__:
+            self.timing['io'] = self.timer.total['io']
 
 
     def reset(self):
         """set Y and time parameters of the model to their original value"""
         self.mdl.reset()
 
+    def computecached(self,*args,**kwargs):
+        """compute(*args,**kwargs), the results being read from (or stored
+            in) a cache.ResultCache given as keyword rescache (the default
+            cache if not given). Vm and t are memory maps on a hit.
+            Returns the key of the cache entry."""
+        rescache = kwargs.pop('rescache',None)
+        if rescache is None:
+            rescache = cache.default()
+        return rescache.compute(self,*args,**kwargs)
+
+    def _protocol(self,tmax,t0,stimCoord,stimCoord2,protocol=None):
+        """Builds the stimulation protocol on the time steps of compute.
+            Without protocol, the boxes stimCoord and stimCoord2 are
+            stimulated by a half-sine of amplitude self.Iamp."""
+        if protocol is None:
+            protocol = stimulus.StimProtocol(self.mdl.Istim.shape)
+            wave = partial(stimulus.halfsine,Iamp=self.Iamp,tmax=tmax)
+            if self.mdl.Y.ndim == 1:
+                protocol.addsite(numpy.ones((),bool),wave)
+            else:
+                assert self.mdl.Y.ndim - 1 == len(stimCoord)/2 and \
+                        self.mdl.Y.ndim - 1 == len(stimCoord2)/2, \
+                        "stimCoord and/or stimCoord2 have incorrect dimensions"
+                protocol.addsite(list(stimCoord),wave)
+                protocol.addsite(list(stimCoord2),wave)
+        nsteps = int(numpy.ceil((tmax-t0)/self.dt))+1
+        self.protocol = protocol.build(t0+self.dt*numpy.arange(nsteps))
+        return self.protocol
+
 
 
+    def _recorder(self,rec=None):
+        """Recorder bound to the grid of the model (whole field if None)."""
+        if rec is None:
+            rec = recorder.Recorder()
+        return rec.bind(self.mdl.Y.shape[:-1],self.mdl)
+
     def show(self):
         """show Vm in a graph. Works for 1D projects only"""
         assert 'Vm' in self.__dict__,"""We could not find the attribute Vm. 
                             Have you tried running "compute" method before?"""
 
         if self.Vm.ndim == 2:
-            assert HASMATPLOT, "Sorry, you have to have pylab installed!"
+            assert hasmatplot(), "Sorry, you have to have pylab installed!"
             pylab.imshow(self.Vm,aspect='auto',cmap=cm.jet)
             pylab.show()
         elif self.Vm.ndim == 3:
-            assert HASMAYAVI, "Sorry, you have to have mayavi installed!"
+            assert hasmayavi(), "Sorry, you have to have mayavi installed!"
             s = mlab.surf(self.Vm[...,1])
             raw_input("Press Enter to lauch the simulation...")
             for i in range(1,self.Vm.shape[-1]):
                 s.mlab_source.scalars = self.Vm[...,i]
         elif self.Vm.ndim == 4:
-            assert HASMAYAVI, "Sorry, you have to have mayavi installed!"
+            assert hasmayavi(), "Sorry, you have to have mayavi installed!"
             p = mlab.pipeline.scalar_field(self.Vm[...,1])
             s = mlab.pipeline.image_plane_widget( p,
                                         plane_orientation='x_axes',
@@ -798,6 +1104,7 @@ class IntGen():
         x = self.Vm[coord1]
         y = self.Vm[coord2]
 
+        from scipy.signal import correlate
         CrossCorrelation = correlate(x-x.mean(),y-y.mean(),mode='same')
 
         i_delay = numpy.argmax(CrossCorrelation)
@@ -808,7 +1115,11 @@ class IntGen():
 
         delay = abs(vectdelay[i_delay]) * self.dt
 
-        if self.mdl.Y.ndim == 2:
+        if self.mdl.graph is not None:
+            p = self.mdl.graph.points
+            dist = numpy.sqrt(((p[numpy.ravel(coord2)[0]] -
+                                        p[numpy.ravel(coord1)[0]])**2).sum())
+        elif self.mdl.Y.ndim == 2:
             dist = abs(coord2 - coord1) * self.mdl.hx
         elif self.mdl.Y.ndim == 3:
             dist = numpy.sqrt( (abs(coord2[0] - coord1[0]) * self.mdl.hx)**2 + \
@@ -819,6 +1130,7 @@ class IntGen():
             coord1[0])  * self.mdl.hz)**2 )
 
         if fshow:
+            assert hasmatplot(), "Sorry, you have to have pylab installed!"
             pylab.subplot(211)
             pylab.plot(self.t,x)
             pylab.plot(self.t,y)
@@ -829,6 +1141,72 @@ class IntGen():
 
         return dist / delay, CrossCorrelation
 
+    def velocity(self,method='gradient',radius=1):
+        """Conduction velocity of every cell (speed in cm/ms and direction)
+            from the activation map, see activation.velocity."""
+        assert 'activation_map' in self.__dict__,"""We could not find the 
+            activation map. Have you tried attaching an ActivationMap before 
+            running "compute"?"""
+        assert self.mdl.graph is None, "velocity needs a grid model"
+        return activation.velocity(self.activation_map,value(self.mdl.hx),
+                value(self.mdl.hy),value(self.mdl.hz),method,radius)
+
+    def delays(self,pairs=None,ref=None,sites=None,Vm=None,chunk=256,
+                                                                maxlag=None):
+        """Delays (ms) between the potentials of pairs of cells, from the
+            peak of their cross-correlation (see xcorr.delays).
+                pairs : list of (coord1,coord2), the delay is positive when
+                    coord2 lags coord1
+                ref,sites : instead of pairs, one reference against many sites
+                Vm : potentials (self.Vm by default), or the filename given to
+                    save (the files are read as memory maps)
+                chunk : number of pairs correlated at once
+                maxlag : largest delay searched (ms)
+            Returns the delays and the normalized correlations at the peaks.
+        """
+        if pairs is None:
+            pairs = [(ref,s) for s in sites]
+        if Vm is None:
+            assert 'Vm' in self.__dict__,"""We could not find the attribute Vm. 
+                            Have you tried running "compute" method before?"""
+            Vm,t = self.Vm,self.t
+        elif isinstance(Vm,str):
+            Vm,t = xcorr.load(Vm)
+            t = t[0]
+        dt = t[1]-t[0]
+        d = numpy.empty(len(pairs))
+        peak = numpy.empty(len(pairs))
+        for k in range(0,len(pairs),chunk):
+            block = [tuple(numpy.atleast_1d(c)) for p in pairs[k:k+chunk]
+                                                                    for c in p]
+            sites = sorted(set(block))
+            num = dict(zip(sites,range(len(sites))))
+            idx = numpy.array([num[c] for c in block]).reshape(-1,2)
+            d[k:k+chunk],peak[k:k+chunk] = xcorr.delays(
+                                xcorr.traces(Vm,sites),idx,dt,maxlag)
+        return d,peak
+
+    def speeds(self,pairs=None,ref=None,sites=None,Vm=None,chunk=256,
+                                                                maxlag=None):
+        """Mean speeds (cm/ms) between pairs of cells, distance over the
+            delay given by delays (same arguments). Returns the speeds and
+            the normalized correlations at the peaks."""
+        if pairs is None:
+            pairs = [(ref,s) for s in sites]
+        d,peak = self.delays(pairs,Vm=Vm,chunk=chunk,maxlag=maxlag)
+        c1 = numpy.array([numpy.atleast_1d(a) for a,b in pairs])
+        c2 = numpy.array([numpy.atleast_1d(b) for a,b in pairs])
+        if self.mdl.graph is not None:
+            p = self.mdl.graph.points
+            dist = numpy.sqrt(((p[c2[:,0]]-p[c1[:,0]])**2).sum(axis=1))
+        else:
+            h = numpy.array([numpy.mean(value(self.mdl.hx)),
+                numpy.mean(value(self.mdl.hy)),
+                numpy.mean(value(self.mdl.hz))])[:c1.shape[1]]
+            dist = numpy.sqrt((((c2-c1)*h)**2).sum(axis=1))
+        with numpy.errstate(divide='ignore'):
+            return dist/numpy.abs(d),peak
+
 class IntSerial(IntGen):
     """Integrator class using serial computation"""
 
@@ -838,27 +1216,25 @@ class IntSerial(IntGen):
         """
         IntGen.__init__(self,mdl)
 
-    def _stim0(self,stimCoord,Ist):
-        self.mdl.Istim = Ist
-    
-    def _stim1(self,stimCoord,Ist):
-        self.mdl.Istim[stimCoord[0]:stimCoord[1]]=Ist
-
-    def _stim2(self,stimCoord,Ist):
-        self.mdl.Istim[stimCoord[0]:stimCoord[1],stimCoord[2]:stimCoord[3]]=Ist
-
-    def _stim3(self,stimCoord,Ist):
-        self.mdl.Istim[stimCoord[0]:stimCoord[1],stimCoord[2]:stimCoord[3],
-                                                stimCoord[4]:stimCoord[5]]=Ist
-
-    def compute(self,tmax=500,stimCoord=-1,stimCoord2=-1):        
+    def compute(self,tmax=500,stimCoord=-1,stimCoord2=-1,protocol=None,
+                                            recorder=None,scheme=None,dt=0.05):
         """Compute.
                 tmax : maximum duration (in ms)
                 stimCoord,stimCoord2 : Coordinates of the stimulations
+                protocol : stimulus.StimProtocol replacing the default
+                    half-sine stimulation of stimCoord and stimCoord2
+                recorder : recorder.Recorder, part of the potential stored in
+                    Vm (whole field by default)
+                scheme : time stepping scheme (schemes.Heun(), 'rk4', ...),
+                    explicit Euler (mdl.derivT) if None
+                dt : time step (in ms)
         """
         self.decim=10
         NbIter=0
-        self.dt=0.05
+        self.dt=dt
+        if isinstance(scheme,str):
+            scheme = schemes.SCHEMES[scheme.lower()]()
+        self.scheme = scheme
         Ft = 0.15
         dtMin = self.dt
         dtMax = 6
@@ -894,45 +1270,26 @@ class IntSerial(IntGen):
 #            self.Vm = numpy.empty((self.mdl.Nx,self.mdl.Ny,self.mdl.Nz,
 #                                                                len(self.t)))
 
-        flag0D = False
-        if self.mdl.Y.ndim == 1:
-            self.Vm = shmarray.zeros(len(self.t))
-            self.stim = self._stim0
-            flag0D = True
-        elif self.mdl.Y.ndim == 2:
-            self.Vm = shmarray.zeros((self.mdl.Nx,len(self.t)))
-            self.stim = self._stim1
-        elif self.mdl.Y.ndim == 3:
-            self.Vm = shmarray.zeros((self.mdl.Nx,self.mdl.Ny,len(self.t)))
-            self.stim = self._stim2
-        elif self.mdl.Y.ndim == 4:
-            self.Vm = shmarray.zeros((self.mdl.Nx,self.mdl.Ny,self.mdl.Nz,
-                                                                len(self.t)))
-
-            self.stim = self._stim3
+        self.recorder = self._recorder(recorder)
+        self.Vm = self.recorder.alloc(len(self.t),shmarray.zeros,grow=True)
 
-        assert flag0D or ( self.mdl.Y.ndim - 1 == len(stimCoord)/2 and \
-                self.mdl.Y.ndim - 1 == len(stimCoord2)/2 ),         \
-                "stimCoord and/or stimCoord2 have incorrect dimensions"
+        protocol = self._protocol(tmax,time,stimCoord,stimCoord2,protocol)
+        self.mdl.stimIdx = protocol.index
+        self._startanalyzers(self.mdl.Y[...,0],time)
+        k = 0
+        timer = self.timer
+        twall = self._starttimer()
 
-        self.mdl.flag = True
-
-
-        Iamp = self.Iamp
         #Integration
         while time<tmax:
-            Ist = Iamp/2*(numpy.sign(numpy.sin(
-            2*numpy.pi*time/(2*tmax)
-            ) )+1)*numpy.sin(2*numpy.pi*time/(2*tmax))
-
-
-            if (time != 0) and (Ist == 0):
-                self.mdl.flag = False
-
-            self.stim(stimCoord,Ist)
-            self.stim(stimCoord2,Ist)
-           # mdl.Istim[50:95,100]=Ist
-            self.mdl.derivT(self.dt)
+            t0 = timer.tic()
+            self.mdl.flag = protocol.apply(self.mdl.Istim,k)
+            k += 1
+            timer.toc('stimulus',t0)
+            if scheme is None:
+                self.mdl.derivT(self.dt)
+            else:
+                scheme.step(self.mdl,self.dt)
             #define new time step
 #            self.dt = dtMin*dVmax/numpy.max(abs(self.mdl.dY[...,0].all())-Ft)
 #            if self.dt > dtMax:
@@ -940,13 +1297,26 @@ class IntSerial(IntGen):
 #            if self.dt < dtMin:
 #                self.dt = dtMin
             time+=self.dt
+            t0 = timer.tic()
+            for a in self.analyzers:
+                if not k%a.every:
+                    a.update(self.mdl.Y[...,0],time)
+            timer.toc('record',t0)
             #stores time and state 
             if not round(time/self.dt)%self.decim:
+                t0 = timer.tic()
                 NbIter+=1
                 self.t[NbIter]=time
-                self.Vm[...,NbIter]=self.mdl.Y[...,0].copy()
-        self.Vm = self.Vm[...,1:NbIter-1]
+                self.recorder.record(self.mdl.Y,self.Vm,NbIter)
+                timer.toc('record',t0)
+        self.Vm = self.recorder.wrap(self.Vm[...,1:NbIter-1],
+                                                    self.t[1:NbIter-1],1)
         self.t = self.t[...,1:NbIter-1]
+        timer.steps = k
+        for a in self.analyzers:
+            a.finish()
+        self._stopanalyzers()
+        self._stoptimer(twall)
 
 class IntParaMP(IntGen):
     """Integrator class using parallel computation"""
@@ -975,8 +1345,18 @@ class IntParaMP(IntGen):
 
         
         
-    def compute(self,tmax=500,stimCoord=-1,stimCoord2=-1,profiling=False):
-        
+    def compute(self,tmax=500,stimCoord=-1,stimCoord2=-1,profiling=False,
+                                        protocol=None,recorder=None,dt=0.05):
+        """Compute.
+                tmax : maximum duration (in ms)
+                stimCoord,stimCoord2 : Coordinates of the stimulations
+                profiling : profiles each process with cProfile
+                protocol : stimulus.StimProtocol replacing the default
+                    half-sine stimulation of stimCoord and stimCoord2
+                recorder : recorder.Recorder, part of the potential stored in
+                    Vm (whole field by default)
+                dt : time step (in ms)
+        """
         try: Nz = self.mdl.Nz 
         except AttributeError: Nz = 0
 
@@ -996,41 +1376,54 @@ class IntParaMP(IntGen):
         else:
             self.mdl.stimCoord2 = stimCoord2
 
-        assert (self.mdl.Y.ndim - 1 == len(stimCoord)/2) and \
-                (self.mdl.Y.ndim - 1 == len(stimCoord2)/2), \
-                "stimCoord and/or stimCoord2 have incorrect dimensions"
-
-        self.dt=0.05
+        self.dt=dt
+        protocol = self._protocol(tmax,0,stimCoord,stimCoord2,protocol)
         
         count = mp.Value('i',0)
         
         p = [0] * self.N
 #        res =  [0] * self.N
 
-        shp = list(self.mdl.Y.shape[:-1])
-        shp.append(round(tmax/(self.dt*20))+1)
-
-        self.Vm = shmarray.zeros(shp, numpy.float)
+        self.recorder = self._recorder(recorder)
+        self.Vm = self.recorder.alloc(round(tmax/(self.dt*20))+1,shmarray.zeros)
         self.t = shmarray.zeros(round(tmax/(self.dt*20))+1, numpy.float)
+        # frame 0: the initial state, the processes record the next ones
+        self.recorder.record(self.Y,self.Vm,0)
         s_mutex = mp.Semaphore(1)
         s_attente = mp.Semaphore(0)
+        if self.timer.enabled:
+            prof = shmarray.zeros((len(self.timer.phases)+1)*self.N)
+        else:
+            prof = None
+        self._startanalyzers(self.Y[...,0],0,shmarray.zeros)
+        twall = self._starttimer()
         
         print 'nombre de processus : ' + str(self.N)
 
         for n in range(self.N): 
             if profiling:
                 p[n] = mp.Process(target=profilepara, args = 
-        (n,tmax,Nx,Ny,Nz,self.N,stimCoord,stimCoord2,self.mdl.getlistparams(),
-        self.Iamp,self.dt,self.Y,self.mdl.mask,count,self.Vm,self.t,s_mutex,
-        s_attente))
+        (n,tmax,Nx,Ny,Nz,self.N,protocol,self.mdl.getlistparams(),self.dt,
+        self.Y,self.mdl.mask,count,self.Vm,self.t,s_mutex,s_attente,prof,
+                                                self.recorder,self.analyzers))
             else:
                 p[n] = mp.Process(target=parallelcompMP, args = 
-        (n,tmax,Nx,Ny,Nz,self.N,stimCoord,stimCoord2,self.mdl.getlistparams(),
-        self.Iamp,self.dt,self.Y,self.mdl.mask,count,self.Vm,self.t,s_mutex,
-        s_attente))
+        (n,tmax,Nx,Ny,Nz,self.N,protocol,self.mdl.getlistparams(),self.dt,
+        self.Y,self.mdl.mask,count,self.Vm,self.t,s_mutex,s_attente,prof,
+                                                self.recorder,self.analyzers))
             p[n].start()
 
         p[0].join()
+        if prof is not None or self.analyzers:
+            for n in range(self.N):
+                p[n].join()
+        if prof is not None:
+            # counters of all the processes, summed
+            for n in range(self.N):
+                self.timer.fromvector(prof.reshape(self.N,-1)[n])
+        self.Vm = self.recorder.wrap(self.Vm,self.t)
+        self._stopanalyzers()
+        self._stoptimer(twall)
 
 
 class IntPara(IntGen):
@@ -1040,7 +1433,7 @@ class IntPara(IntGen):
         """The constructor.
                 mdl : model (of class Red3 or Red6)
         """
-        assert HASMPI, "mpi does not seem to be present in your system.. sorry!"
+        assert hasmpi(), "mpi does not seem to be present in your system.. sorry!"
         IntGen.__init__(self,mdl)
         #find the engine processes
         rc = Client(profile='mpi')
@@ -1071,14 +1464,21 @@ class IntPara(IntGen):
             self.nbx = nCl
             self.nby = 0
 
-    def compute(self,tmax=500,stimCoord=-1,stimCoord2=-1):
+    def compute(self,tmax=500,stimCoord=-1,stimCoord2=-1,protocol=None,
+                                                        recorder=None,dt=0.05):
         """Compute.
                 tmax : maximum duration (in ms)
                 stimCoord,stimCoord2 : Coordinates of the stimulations
+                protocol : stimulus.StimProtocol replacing the default
+                    half-sine stimulation of stimCoord and stimCoord2
+                recorder : recorder.Recorder, part of the potential stored in
+                    Vm (whole field by default), applied to the frames
+                    gathered from the engines
+                dt : time step (in ms)
         """
 
-        def parallelcomp(tmax,Nx,Ny,Nz,nbx,nby,stimCoord,stimCoord2,listparam,
-                                                                    Iamp,dt):
+        def parallelcomp(tmax,Nx,Ny,Nz,nbx,nby,protocol,listparam,dt,
+                                            profiled=False,analyzers=()):
             """Function used by the engine processes"""            
 
             import cell_mdl
@@ -1113,101 +1513,49 @@ class IntPara(IntGen):
 
 
             rank = MPI.COMM_WORLD.Get_rank()
-            # Which rows should I compute?
-            [x,newNx] = findlimitsx(rank,nbx,Nx+4)
-
-            #Stimulation (global coordinates)
-            xyIstim1 = stimCoord 
-            xyIstim2 = stimCoord2
-
-            #computing the local coordinates
-            if (xyIstim1[0] > x[-1]) or (xyIstim1[1] < x[0]):
-                xyIstim1[0:2] = [-1,-1]
+            bc = listparam['bc']
+            if bc is None:
+                pad = 4
             else:
-                xyIstim1[0:2] = [max(xyIstim1[0],x[0])-x[0],
-                                min(xyIstim1[1],x[-1])-x[0]]
-
-            if (xyIstim2[0] > x[-1]) or (xyIstim2[1] < x[0]):
-                xyIstim2[0:2] = [-1,-1]
-            else:
-                xyIstim2[0:2] = [max(xyIstim2[0],x[0])-x[0],
-                                min(xyIstim2[1],x[-1])-x[0]]
+                pad = 2
+            # Which rows should I compute?
+            [x,newNx] = findlimitsx(rank,nbx,Nx+pad)
 
             # What about the columns?
             if Ny:
-                [y,newNy] = findlimitsy(rank,nby,Ny+4,nbx)
-
-                if (xyIstim1[2] > y[-1]) or (xyIstim1[3] < y[0]):
-                    xyIstim1[2:4] = [-1,-1]
-                else:
-                    xyIstim1[2:4] = [max(xyIstim1[2],y[0])-y[0],
-                                    min(xyIstim1[3],y[-1])-y[0]]
-
-                if (xyIstim2[2] > y[-1]) or (xyIstim2[3] < y[0]):
-                    xyIstim2[2:4] = [-1,-1]
-                else:
-                    xyIstim2[2:4] = [max(xyIstim2[2],y[0])-y[0],
-                                    min(xyIstim2[3],y[-1])-y[0]]
-                
-                Ny2 = newNy-2*(rank/nbx==0)-2*(rank/nbx==(nby-1))
+                [y,newNy] = findlimitsy(rank,nby,Ny+pad,nbx)
+                Ny2 = newNy-pad/2*(rank/nbx==0)-pad/2*(rank/nbx==(nby-1))
             else:  
                 y = 0
                 Ny2 = 0
+
+            #Stimulation (local coordinates)
+            if Ny:
+                protocol = protocol.local([x,y])
+            else:
+                protocol = protocol.local([x])
             
 
             #Creation of the model (one for each process)
             mpi=[(rank%nbx==0),rank%nbx==(nbx-1),(rank/nbx==0),
                 (rank/nbx==(nby-1)),True,True]
+            Nx2 = newNx-pad/2*(rank%nbx==0)-pad/2*(rank%nbx==(nbx-1))
             if listparam['Name'] == 'Red6':
-                mdl=cell_mdl.Red6(
-        Nx=newNx-2*(rank%nbx==0)-2*(rank%nbx==(nbx-1)),Ny=Ny2,Nz=Nz,borders=mpi
-                                 )
+                mdl=cell_mdl.Red6(Nx=Nx2,Ny=Ny2,Nz=Nz,borders=mpi,bc=bc)
             elif listparam['Name'] == 'Red3':
-                mdl=cell_mdl.Red3(
-        Nx=newNx-2*(rank%nbx==0)-2*(rank%nbx==(nbx-1)),Ny=Ny2,Nz=Nz,borders=mpi
-                                 )
+                mdl=cell_mdl.Red3(Nx=Nx2,Ny=Ny2,Nz=Nz,borders=mpi,bc=bc)
+            bc = mdl.bc
             mdl.setlistparams(listparam)
+            mdl.bc = bc
             mdl.Name += 'p'
 
-            def modify(var,x,y):
-                if not(isinstance(var,int)) and not(isinstance(var,float)):
-                    if var.ndim == 1:
-                        return var[x[0]:x[1]]
-                    elif var.ndim == 2:
-                        return var[x[0]:x[1],y[0]:y[1]]
-                    else:
-                        return var[x[0]:x[1],y[0]:y[1],:]
-                else:
-                    return var
-
-            mdl.masktempo = modify(mdl.masktempo,x,y)
-            mdl.hx = modify(mdl.hx,x,y)
-            mdl.hy = modify(mdl.hy,x,y)
-            mdl.hz = modify(mdl.hz,x,y)
-            mdl.Rax = modify(mdl.Rax,x,y)
-            mdl.Ray = modify(mdl.Ray,x,y)
-            mdl.Raz = modify(mdl.Raz,x,y)
+            if Ny:
+                mdl.restrictparams((slice(x[0],x[1]),slice(y[0],y[1])))
+            else:
+                mdl.restrictparams((slice(x[0],x[1]),))
 
             #Tells the model where the stimuli are
-            if xyIstim1[0] != -1 and (Ny and xyIstim1[2] != -1):
-                mdl.stimCoord = xyIstim1
-            if xyIstim2[0] != -1 and (Ny and xyIstim2[2] != -1):
-                mdl.stimCoord2 = xyIstim2
-
-            def _stim1(mdl,stimCoord,Ist):
-                if stimCoord[0] != -1:
-                    mdl.Istim[stimCoord[0]:stimCoord[1]]=Ist
-
-            def _stim2(mdl,stimCoord,Ist):
-                if stimCoord[0] != -1 and stimCoord[2] != -1:
-                    mdl.Istim[stimCoord[0]:stimCoord[1],
-                              stimCoord[2]:stimCoord[3]]=Ist
-
-            def _stim3(mdl,stimCoord,Ist):
-                if stimCoord[0] != -1 and stimCoord[2] != -1:
-                    mdl.Istim[stimCoord[0]:stimCoord[1],
-                              stimCoord[2]:stimCoord[3],
-                              stimCoord[4]:stimCoord[5]]=Ist
+            mdl.stimIdx = protocol.index
 
             def _comm1(mdl,rank,test,nbx):
                 from mpi4py import MPI
@@ -1349,40 +1697,42 @@ class IntPara(IntGen):
 
             if Nx*Ny*Nz:
                 Vm=numpy.zeros((mdl.Nx,mdl.Ny,mdl.Nz,round(tmax/(dt*decim))+1))
-                stim = _stim3
                 comm = _comm3
                 test = [rank%2,rank%nbx != 0,rank%nbx != nbx-1,
                         rank/nbx != 0,rank/nbx != nby-1]
             elif Nx*Ny:
                 Vm=numpy.zeros((mdl.Nx,mdl.Ny,round(tmax/(dt*decim))+1))
-                stim = _stim2
                 comm = _comm2
                 test = [rank%2,rank%nbx != 0,rank%nbx != nbx-1,
                         rank/nbx != 0,rank/nbx != nby-1]
             elif Nx:
                 Vm=numpy.zeros((mdl.Nx,round(tmax/(dt*decim))+1))
-                stim = _stim1
                 comm = _comm1
                 test = [rank%2,rank%nbx != 0,rank%nbx != nbx-1]
             
-            mdl.flag = True
             mdl.time = 0
+            k = 0
+            timer = cell_mdl.timing.PhaseTimer(profiled)
+            mdl.timer = timer
+            for a in analyzers:
+                a.start(mdl.Y[...,0],mdl.time)
 
 
             while (mdl.time<tmax):
-                Ist=Iamp/2*(numpy.sign(numpy.sin(
-                        2*numpy.pi*mdl.time/(2*tmax))
-                        )+1)*numpy.sin(2*numpy.pi*mdl.time/(2*tmax))
-
-                if (mdl.time != 0) and (Ist == 0):
-                    mdl.flag = False
-                stim(mdl,xyIstim1,Ist)
-                stim(mdl,xyIstim2,Ist)
+                t0 = timer.tic()
+                mdl.flag = protocol.apply(mdl.Istim,k)
+                k += 1
+                timer.toc('stimulus',t0)
 
                 mdl.derivT(dt)
+                t0 = timer.tic()
                 comm(mdl,rank,test,nbx)
+                t0 = timer.toc('sync',t0)
                         
                 mdl.time +=dt
+                for a in analyzers:
+                    if not k%a.every:
+                        a.update(mdl.Y[...,0],mdl.time)
                 if not round(mdl.time/dt)%decim:
                     NbIter+=1
                     time[NbIter]=mdl.time
@@ -1392,8 +1742,90 @@ class IntPara(IntGen):
                         Vm[:,:,NbIter]=mdl.Y[:,:,0].copy()
                     elif Nx:
                         Vm[:,NbIter]=mdl.Y[:,0].copy()
+                    timer.toc('record',t0)
+
+            timer.steps = k
+            for a in analyzers:
+                a.finish()
+            return {'rank':rank,'time':time,'x':x,'y':y,'Vm':Vm,
+                            'timing':timer.tovector(),'analyzers':analyzers}
+
+        def parallelcompg(tmax,protocol,listparam,dt,profiled=False,
+                                                                analyzers=()):
+            """Function used by the engine processes (cell graph)"""
+
+            import cell_mdl
+            from mpi4py import MPI
+
+            rank = MPI.COMM_WORLD.Get_rank()
+            size = MPI.COMM_WORLD.Get_size()
+            graph = listparam['graph']
 
-            return {'rank':rank,'time':time,'x':x,'y':y,'Vm':Vm}
+            # Which cells should I compute? (contiguous blocks, no overlap)
+            bounds = numpy.linspace(0,graph.ncells,size+1).astype(int)
+            x = [bounds[rank],bounds[rank+1]]
+            counts = numpy.diff(bounds)
+
+            #Stimulation (local coordinates)
+            protocol = protocol.local([x])
+
+            #Creation of the model (one for each process)
+            if listparam['Name'] == 'Red6':
+                mdl=cell_mdl.Red6(0,graph=graph.rows(x[0],x[1]))
+            elif listparam['Name'] == 'Red3':
+                mdl=cell_mdl.Red3(0,graph=graph.rows(x[0],x[1]))
+            graph = mdl.graph
+            mdl.setlistparams(listparam)
+            mdl.graph = graph
+            mdl.restrictparams((slice(x[0],x[1]),))
+            mdl.Name += 'p'
+            mdl.stimIdx = protocol.index
+
+            #potentials of all the cells, gathered after each step
+            V = numpy.empty(listparam['graph'].ncells)
+            def comm(mdl):
+                MPI.COMM_WORLD.Allgatherv(mdl.Y[:,0].copy(),
+                                        [V,counts,bounds[:-1],MPI.DOUBLE])
+            mdl.Vsrc = V
+            comm(mdl)
+
+            decim=20
+            NbIter=0
+            time=numpy.zeros(round(tmax/(dt*decim))+1)
+            Vm=numpy.zeros((mdl.Nx,round(tmax/(dt*decim))+1))
+            mdl.time = 0
+            k = 0
+            timer = cell_mdl.timing.PhaseTimer(profiled)
+            mdl.timer = timer
+            for a in analyzers:
+                a.start(mdl.Y[:,0],mdl.time)
+
+            while (mdl.time<tmax):
+                t0 = timer.tic()
+                mdl.flag = protocol.apply(mdl.Istim,k)
+                k += 1
+                timer.toc('stimulus',t0)
+
+                mdl.derivT(dt)
+                t0 = timer.tic()
+                comm(mdl)
+                t0 = timer.toc('sync',t0)
+
+                mdl.time +=dt
+                for a in analyzers:
+                    if not k%a.every:
+                        a.update(mdl.Y[:,0],mdl.time)
+                if not round(mdl.time/dt)%decim:
+                    NbIter+=1
+                    time[NbIter]=mdl.time
+                    Vm[:,NbIter]=mdl.Y[:,0]
+                    timer.toc('record',t0)
+
+            timer.steps = k
+            for a in analyzers:
+                a.finish()
+            return {'rank':rank,'time':time,'x':x,'y':0,'Vm':Vm,
+                            'timing':timer.tovector(),'analyzers':analyzers}
 
         try: Nz = self.mdl.Nz - self.mdl.Padding
         except AttributeError: Nz = 0
@@ -1414,17 +1846,34 @@ class IntPara(IntGen):
             self.mdl.stimCoord2 = stimCoord2
 
 
-        assert (self.mdl.Y.ndim - 1 == len(stimCoord)/2) and \
-                (self.mdl.Y.ndim - 1 == len(stimCoord2)/2), \
-                "stimCoord and/or stimCoord2 have incorrect dimensions"
-
-
-        self.dt=0.05
-        res = self.view.apply_async(parallelcomp,tmax,Nx,Ny,Nz,self.nbx,
-    self.nby,stimCoord,stimCoord2,self.mdl.getlistparams(),self.Iamp,self.dt)
+        assert self.mdl.spec is None, \
+                            "spectral diffusion is not supported by IntPara"
+        if self.mdl.bc is not None:
+            kind = self.mdl.bc.kind
+            assert kind[0] != 'periodic' or self.nbx == 1, \
+                    "periodic X boundaries need the rows on one engine"
+            assert kind[1] != 'periodic' or self.nby <= 1, \
+                    "periodic Y boundaries need the columns on one engine"
+
+        self.dt=dt
+        protocol = self._protocol(tmax,0,stimCoord,stimCoord2,protocol)
+        twall = self._starttimer()
+        if self.mdl.graph is not None:
+            res = self.view.apply_async(parallelcompg,tmax,protocol,
+                        self.mdl.getlistparams(),self.dt,self.timer.enabled,
+                                        [a.local() for a in self.analyzers])
+        else:
+            res = self.view.apply_async(parallelcomp,tmax,Nx,Ny,Nz,self.nbx,
+                self.nby,protocol,self.mdl.getlistparams(),self.dt,
+                    self.timer.enabled,[a.local() for a in self.analyzers])
 
+        t0 = self.timer.tic()
         self.view.wait(res)  #wait for the results
         tabResults = res.get()
+        self.timer.toc('wait',t0)
+        # counters of all the engines, summed
+        for r in tabResults:
+            self.timer.fromvector(r['timing'])
 
 
 #        tabResults  = self.view.apply_sync(parallelcomp,tmax,Nx,Ny,Nz,self.nbx,
@@ -1448,6 +1897,7 @@ class IntPara(IntGen):
 #        v = tabResults[0]['Vm']
 
         # Aggregation of the results
+        self._startanalyzers(self.mdl.Y[...,0],0)
         if Nx*Ny*Nz:
             self.Vm = numpy.empty((Nx+self.mdl.Padding,Ny+self.mdl.Padding,
                                             Nz+self.mdl.Padding,len(self.t)))
@@ -1464,10 +1914,24 @@ class IntPara(IntGen):
             if y:
                 self.Vm[x[0]:x[1],y[0]:y[1],...] = \
                                         numpy.array(tabResults[i_client]['Vm'])
+                sl = (slice(x[0],x[1]),slice(y[0],y[1]))
             else:
                 self.Vm[x[0]:x[1],:] = numpy.array(tabResults[i_client]['Vm'])
+                sl = slice(x[0],x[1])
+            # analyzers of the engines, gathered on the whole grid
+            for a,b in zip(self.analyzers,tabResults[i_client]['analyzers']):
+                a.gather(b,sl)
 
         self.t = self.t[...,1:]
         self.Vm = self.Vm[...,1:]
+        self.recorder = self._recorder(recorder)
+        if self.recorder.mode != 'full' or self.recorder.quantize is not None \
+                                    or self.recorder.adaptive is not None:
+            Vm = self.recorder.alloc(self.Vm.shape[-1])
+            for k in range(self.Vm.shape[-1]):
+                self.recorder.record(self.Vm[...,k:k+1],Vm,k)
+            self.Vm = self.recorder.wrap(Vm,self.t)
+        self._stopanalyzers()
+        self._stoptimer(twall)
 
         return self.t,self.Vm
@@ -0,0 +1,136 @@
+"""Spatially varying conduction parameters:
+ParamField: parameter stored as a scalar, a region label map with a lookup
+    table, or a full field.
+Conductivity: variable coefficient (and anisotropic) diffusion stencil, built
+    once from the parameters of a model."""
+
+import numpy
+
+class ParamField(object):
+    """Compact spatially varying parameter."""
+
+    def __init__(self,table,labels=None):
+        """The constructor.
+                table : scalar or full field if labels is None, values of the
+                    regions otherwise
+                labels : integer array, region number of each cell
+        """
+        if labels is None:
+            self.table = table
+            self.labels = None
+        else:
+            self.table = numpy.asarray(table,float)
+            self.labels = numpy.asarray(labels,
+                                numpy.min_scalar_type(len(self.table)-1))
+
+    def full(self):
+        """Scalar or array value of the parameter on every cell."""
+        if self.labels is None:
+            return self.table
+        return self.table[self.labels]
+
+    def _get_ndim(self):
+        """accessor of ndim"""
+        if self.labels is None:
+            return numpy.ndim(self.table)
+        return self.labels.ndim
+    ndim = property(_get_ndim)
+
+    def _get_nbytes(self):
+        """accessor of nbytes"""
+        if self.labels is None:
+            return numpy.asarray(self.table).nbytes
+        return self.table.nbytes + self.labels.nbytes
+    nbytes = property(_get_nbytes)
+
+    def __getitem__(self,sl):
+        """Parameter on a subdomain."""
+        if self.labels is None:
+            if numpy.ndim(self.table) == 0:
+                return self
+            return ParamField(self.table[sl])
+        return ParamField(self.table,self.labels[sl])
+
+    def __repr__(self):
+        if self.labels is None and numpy.ndim(self.table) == 0:
+            return "ParamField(" + str(self.table) + ")"
+        return "ParamField(" + str(self.ndim) + "D, " + str(self.nbytes) + \
+                                                                    " bytes)"
+
+def value(p):
+    """Scalar or array value of a parameter, ParamField or not."""
+    if isinstance(p,ParamField):
+        return p.full()
+    return p
+
+def harmonic(g,axis):
+    """Conductances of the faces between cells i and i+1 along axis
+        (harmonic mean, periodic like the wrap mode of the stencil)."""
+    if numpy.ndim(g) == 0:
+        return g
+    g2 = numpy.roll(g,-1,axis)
+    s = g+g2
+    return numpy.where(s>0,2*g*g2/numpy.where(s>0,s,1),0)
+
+class Conductivity(object):
+    """Variable coefficient diffusion stencil.
+        Cell conductances g_ab = sigma_ab/(Cm*h_a*h_b) are turned into face
+        conductances (harmonic mean) once; the Laplacian is then the
+        divergence of the face fluxes, plus the mixed derivatives of the
+        anisotropic case. Uniform scalar parameters keep scalar
+        coefficients."""
+
+    def __init__(self,shape,Cm,h,Ra,fiber=None,Rl=None,Rt=None,skip=()):
+        """The constructor.
+                shape : shape of the grid
+                Cm : membrane capacitance
+                h : cell sizes along each axis
+                Ra : axial resistances along each axis (isotropic case)
+                fiber : array of shape shape+(ndim,), fiber direction of each
+                    cell, or None
+                Rl,Rt : axial resistances along and across the fibers
+                skip : axes whose diffusion is computed elsewhere (spectral)
+        """
+        self.ndim = len(shape)
+        self.skip = skip
+        Cm = value(Cm)
+        h = [value(hi) for hi in h]
+        g = {}
+        if fiber is None:
+            for a in range(self.ndim):
+                g[a,a] = 1./(value(Ra[a])*Cm*h[a]**2)
+        else:
+            f = numpy.asarray(fiber,float)
+            assert f.shape == tuple(shape)+(self.ndim,), \
+                                            "fiber has incorrect dimensions"
+            f = f/numpy.sqrt((f**2).sum(axis=-1))[...,numpy.newaxis]
+            sl = 1./value(Rl)
+            st = 1./value(Rt)
+            for a in range(self.ndim):
+                for b in range(a,self.ndim):
+                    g[a,b] = ((sl-st)*f[...,a]*f[...,b] + st*(a==b))/        \
+                                                            (Cm*h[a]*h[b])
+        self.face = [harmonic(g[a,a],a) for a in range(self.ndim)]
+        self.cross = [(a,b,g[a,b]) for (a,b) in sorted(g) if a != b and
+                                                    numpy.any(g[a,b] != 0)]
+        assert not (self.cross and skip), \
+                            "anisotropic conductivity needs the stencil on Y"
+
+    def diff(self,V):
+        """Computes the Laplacian of V."""
+        Dif = numpy.zeros(V.shape)
+        for ax in range(self.ndim):
+            if ax in self.skip:
+                continue
+            F = self.face[ax]*(numpy.roll(V,-1,ax)-V)
+            Dif += F - numpy.roll(F,1,ax)
+        for a,b,gab in self.cross:
+            Db = gab*(numpy.roll(V,-1,b)-numpy.roll(V,1,b))
+            Dif += (numpy.roll(Db,-1,a)-numpy.roll(Db,1,a))/4
+            Da = gab*(numpy.roll(V,-1,a)-numpy.roll(V,1,a))
+            Dif += (numpy.roll(Da,-1,b)-numpy.roll(Da,1,b))/4
+        return Dif
+
+    def __repr__(self):
+        return "Conductivity(" + str(self.ndim) + "D" + \
+                                        ", anisotropic"*bool(self.cross) + ")"
@@ -0,0 +1,205 @@
+"""Sparse event output:
+EventStream: online analyzer emitting (cell, time, kind) records for the
+    upstrokes and downstrokes of the potential, with a refractory period,
+    written to disk in chunks.
+read: events of a file as a structured array."""
+
+import numpy
+import tempfile
+import glob
+import os
+
+#record of an event, cell is the flat index of the cell in the model grid
+EVENT = numpy.dtype([('cell',numpy.int64),('time',numpy.float64),
+                                                        ('kind',numpy.int8)])
+#kinds of events
+UP = 1
+DOWN = -1
+
+def read(filename):
+    """Events stored in filename, as a read-only memory map."""
+    if not os.path.getsize(filename):
+        return numpy.zeros(0,EVENT)
+    return numpy.memmap(filename,dtype=EVENT,mode='r')
+
+class EventStream(object):
+    """Upstroke and downstroke events.
+        An upstroke is the upward crossing of the threshold by a cell that
+        is not refractory (its last upstroke is older than refractory ms),
+        the downstroke is the next downward crossing; times are interpolated
+        linearly between two updates.
+        The events are kept in a buffer; with a filename, the buffer is
+        appended to the file when full (chunk events). The processes of
+        IntParaMP write their own part files, appended to the file at the
+        end of compute, so the events are ordered by time within each
+        process only."""
+
+    def __init__(self,threshold=-30.0,refractory=50.0,filename=None,
+                                                        chunk=65536,every=1):
+        """The constructor.
+                threshold : potential (mV)
+                refractory : minimum time between two upstrokes of a cell (ms)
+                filename : file receiving the events (memory only if None)
+                chunk : number of events buffered before writing
+                every : updated every this number of steps
+        """
+        self.threshold = threshold
+        self.refractory = refractory
+        self.filename = filename
+        self.chunk = chunk
+        self.every = every
+
+    def local(self):
+        """Copy used by an engine of IntPara (events kept in memory)."""
+        return EventStream(self.threshold,self.refractory,None,self.chunk,
+                                                                    self.every)
+
+    def start(self,V,t,zeros=numpy.zeros):
+        """Initial potential V at time t, zeros allocates the arrays
+            (shmarray.zeros when they are shared between processes)."""
+        self.shape = V.shape
+        self.pid = os.getpid()
+        self.prev = zeros(V.shape)
+        self.prev[...] = V
+        self.last = zeros(V.shape)
+        self.last[...] = -numpy.inf
+        self.active = zeros(V.shape)
+        self.tprev = t
+        self.buf = numpy.empty(self.chunk,EVENT)
+        self.n = 0
+        self.owner = None
+        self.ngathered = 0
+        if self.filename is None:
+            self.base = os.path.join(tempfile.mkdtemp(),'events')
+        else:
+            self.base = self.filename
+            open(self.filename,'wb').close()
+        for f in glob.glob(self.base+'.part*'):
+            os.remove(f)
+
+    def _target(self):
+        """File written by this process, None if memory only."""
+        if os.getpid() != self.pid:
+            return self.base+'.part'+str(os.getpid())
+        return self.filename
+
+    def flush(self):
+        """Writes the buffered events."""
+        target = self._target()
+        if target is None or not self.n:
+            return
+        f = open(target,'ab')
+        self.buf[:self.n].tofile(f)
+        f.close()
+        self.n = 0
+
+    def _emit(self,cells,times,kind):
+        """Appends events to the buffer."""
+        m = len(cells)
+        if self.n+m > len(self.buf):
+            if self._target() is not None:
+                self.flush()
+            if self.n+m > len(self.buf):
+                buf = numpy.empty(max(2*len(self.buf),self.n+m),EVENT)
+                buf[:self.n] = self.buf[:self.n]
+                self.buf = buf
+        new = self.buf[self.n:self.n+m]
+        new['cell'] = cells
+        new['time'] = times
+        new['kind'] = kind
+        self.n += m
+
+    def _cells(self,mask,sl):
+        """Flat indices in the grid of the cells of mask (part sl)."""
+        idx = numpy.flatnonzero(mask)
+        if sl is not Ellipsis:
+            idx += sl.start*int(numpy.prod(self.shape[1:]))
+        return idx
+
+    def update(self,V,t,sl=Ellipsis):
+        """Potential V at time t; V is the part sl of the grid (Ellipsis or
+            a slice of the first axis)."""
+        prev = self.prev[sl]
+        thr = self.threshold
+        above = V >= thr
+        was = prev >= thr
+        up = above & ~was & (t-self.last[sl] >= self.refractory)
+        if up.any():
+            p = prev[up]
+            tc = self.tprev + (t-self.tprev)*(thr-p)/(V[up]-p)
+            self.last[sl][up] = tc
+            self.active[sl][up] = 1
+            self._emit(self._cells(up,sl),tc,UP)
+        down = was & ~above & (self.active[sl] > 0)
+        if down.any():
+            p = prev[down]
+            tc = self.tprev + (t-self.tprev)*(thr-p)/(V[down]-p)
+            self.active[sl][down] = 0
+            self._emit(self._cells(down,sl),tc,DOWN)
+        prev[...] = V
+        self.tprev = t
+
+    def _cleanup(self):
+        """Removes the temporary directory of the part files."""
+        if self.filename is None:
+            try:
+                os.rmdir(os.path.dirname(self.base))
+            except OSError:
+                pass
+
+    def finish(self):
+        """End of the time loop of a process."""
+        self.flush()
+        if os.getpid() == self.pid:
+            self._cleanup()
+
+    def events(self):
+        """Events in memory (ordered by time), or in the file."""
+        if self.filename is None:
+            ev = self.buf[:self.n]
+            return ev[numpy.argsort(ev['time'],kind='mergesort')]
+        self.flush()
+        return read(self.filename)
+
+    def gather(self,other,sl):
+        """Adds the events of other, computed on the part sl of the grid (a
+            cell seen by several engines keeps the events of the first)."""
+        if not isinstance(sl,tuple):
+            sl = (sl,)
+        if self.owner is None:
+            self.owner = -numpy.ones(self.shape,int)
+        ev = other.events()
+        start = [s.start for s in sl] + [0]*(len(self.shape)-len(sl))
+        idx = numpy.unravel_index(ev['cell'],other.shape)
+        cells = numpy.ravel_multi_index(tuple([i+s for i,s in
+                                        zip(idx,start)]),self.shape)
+        own = self.owner[sl]
+        own[own < 0] = self.ngathered
+        keep = self.owner.flat[cells] == self.ngathered
+        self.ngathered += 1
+        for kind in (UP,DOWN):
+            k = keep & (ev['kind'] == kind)
+            self._emit(cells[k],ev['time'][k],kind)
+
+    def results(self):
+        """Attributes given to the integrator: events, the structured array
+            of the events (memory map of the file if there is one)."""
+        parts = sorted(glob.glob(self.base+'.part*'))
+        if self.filename is None:
+            for p in parts:
+                ev = read(p)
+                self._emit(ev['cell'],ev['time'],ev['kind'])
+        else:
+            self.flush()
+            f = open(self.filename,'ab')
+            for p in parts:
+                read(p).tofile(f)
+            f.close()
+        for p in parts:
+            os.remove(p)
+        self._cleanup()
+        return {'events':self.events()}
+
+    def __repr__(self):
+        return "EventStream(threshold=" + str(self.threshold) + " mV, " + \
+                        "refractory=" + str(self.refractory) + " ms)"
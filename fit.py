@@ -0,0 +1,200 @@
+"""Fitting of cell model parameters on target recordings:
+Fit: cost of parameter sets (distance to a target trace and/or burst
+    frequency) computed on batches of single cells (cell0d), and fitted by
+    differential evolution; every evaluation is cached (memory, and a shelve
+    file when given) so repeated fits do not recompute.
+frequency: burst frequency of traces."""
+
+import numpy
+import shelve
+import pickle
+import multiprocessing as mp
+import cell0d
+import cache
+import cell_mdl
+
+def frequency(t,V,threshold=-30.0):
+    """Frequency (Hz) of the upward crossings of threshold of the traces V
+        (one per row) sampled at t (ms)."""
+    V = numpy.atleast_2d(V)
+    up = ((V[:,1:] >= threshold) & (V[:,:-1] < threshold)).sum(axis=1)
+    return up*1000.0/(t[-1]-t[0])
+
+def _picklable(obj):
+    """True if obj can be sent to the processes of a pool."""
+    try:
+        pickle.dumps(obj,2)
+    except (pickle.PicklingError,TypeError,AttributeError):
+        return False
+    return True
+
+def _simulate(args):
+    """Potential (one row per parameter set) of the cells of parameters X,
+        nan for the sets where the integration fails. The cells are models
+        of class name with the parameters p (picklable arguments of the
+        processes)."""
+    name,p,Y0,names,X,tmax,wave,t_eval,maxstep = args
+    p = dict(p)
+    p.update(zip(names,numpy.transpose(X)))
+    try:
+        s = cell0d.solve(getattr(cell_mdl,name)(0),tmax,Y0,wave,t_eval,
+                                                        maxstep=maxstep,**p)
+        return s.Y[:,0]
+    except Exception:
+        if len(X) == 1:
+            return numpy.nan*numpy.ones((1,len(t_eval)))
+        return numpy.concatenate([_simulate((name,p,Y0,names,X[i:i+1],tmax,
+                            wave,t_eval,maxstep)) for i in range(len(X))])
+
+class Fit(object):
+    """Fit of free parameters of a Red3 or Red6 model.
+        The cost of a parameter set is the root mean square difference with
+        the target trace (mV) plus the relative error of the burst frequency,
+        weighted. The cells of a population are integrated together (one
+        batch per process)."""
+
+    def __init__(self,mdl,free,bounds,tmax,t=None,V=None,freq=None,wave=None,
+                    threshold=-30.0,weights=(1.0,1.0),processes=1,
+                    cachefile=None,maxstep=5.0):
+        """The constructor.
+                mdl : model giving the fixed parameters (0D or not)
+                free : names of the fitted parameters (from mdl.parlist)
+                bounds : (low,high) of each free parameter
+                tmax : duration of the simulations (ms)
+                t,V : target trace (the simulations are sampled at t), or None
+                freq : target burst frequency (Hz), or None
+                wave : stimulation current, function of a time array
+                    (picklable when processes > 1: a module-level function
+                    or a functools.partial of one, not a lambda)
+                threshold : potential of the burst detection (mV)
+                weights : weights of the trace and frequency costs
+                processes : number of processes evaluating a population
+                cachefile : shelve file keeping the evaluations between runs
+                maxstep : largest time step of the solver (ms)
+        """
+        name = mdl.__class__.__name__
+        for par in free:
+            assert par in mdl.parlist and par in cell0d.NAMES[name], \
+                                        par + " is not a parameter of the cells"
+        assert len(bounds) == len(free), "one (low,high) per free parameter"
+        assert V is not None or freq is not None, "no target"
+        assert processes <= 1 or _picklable(wave), \
+                    "wave must be picklable (not a lambda) when processes > 1"
+        self.mdl = mdl
+        self.free = list(free)
+        self.bounds = numpy.array(bounds,float)
+        self.tmax = tmax
+        if t is None:
+            t = numpy.arange(0,tmax+1e-9,1.)
+        self.t = numpy.asarray(t,float)
+        self.V = None if V is None else numpy.asarray(V,float)
+        self.freq = freq
+        self.wave = wave
+        self.threshold = threshold
+        self.weights = weights
+        self.processes = processes
+        self.cachefile = cachefile
+        self.maxstep = maxstep
+        self.evals = {}
+        self.nsim = 0
+        #the waveform is digested with its code, the costs with the version
+        #of the simulation code
+        self.config = cache.digest(cache.codeversion(),name,cell0d.params(mdl),
+                    numpy.reshape(mdl.Y,(-1,mdl.dim))[0],self.free,
+                        self.t,self.V,freq,wave,threshold,weights,tmax,maxstep)
+
+    def simulate(self,X):
+        """Potentials (one row per parameter set of X) at self.t."""
+        X = numpy.atleast_2d(X)
+        self.nsim += len(X)
+        p = cell0d.params(self.mdl)
+        Y0 = numpy.reshape(self.mdl.Y,(-1,self.mdl.dim))[:1]
+        args = [(self.mdl.__class__.__name__,p,Y0,self.free,x,self.tmax,
+                self.wave,self.t,self.maxstep) for x in
+                        numpy.array_split(X,min(self.processes,len(X)))]
+        if self.processes > 1:
+            pool = mp.Pool(self.processes)
+            res = pool.map(_simulate,args)
+            pool.close()
+            pool.join()
+        else:
+            res = map(_simulate,args)
+        return numpy.concatenate(res)
+
+    def _cost(self,V):
+        """Costs of the simulated potentials V."""
+        c = numpy.zeros(len(V))
+        if self.V is not None:
+            c += self.weights[0]*numpy.sqrt(((V-self.V)**2).mean(axis=1))
+        if self.freq is not None:
+            f = frequency(self.t,V,self.threshold)
+            c += self.weights[1]*numpy.abs(f-self.freq)/max(self.freq,1e-9)
+        return numpy.where(numpy.isnan(c),numpy.inf,c)
+
+    def cost(self,X):
+        """Costs of the parameter sets X (one per row), computed for the sets
+            not evaluated yet."""
+        X = numpy.atleast_2d(numpy.asarray(X,float))
+        keys = [self.config+cache.digest(x) for x in X]
+        store = shelve.open(self.cachefile) if self.cachefile else {}
+        for k in keys:
+            if k not in self.evals and k in store:
+                self.evals[k] = store[k]
+        new = [i for i,k in enumerate(keys) if k not in self.evals]
+        if new:
+            for i,c in zip(new,self._cost(self.simulate(X[new]))):
+                self.evals[keys[i]] = c
+                store[keys[i]] = c
+        if self.cachefile:
+            store.close()
+        return numpy.array([self.evals[k] for k in keys])
+
+    def run(self,popsize=15,maxiter=50,mutation=(0.5,1.0),recombination=0.7,
+                                                        tol=0.01,seed=None):
+        """Differential evolution (rand/1/bin, dithered mutation), the
+            population (popsize per free parameter) being evaluated at once.
+            Stops when the spread of the costs is below tol times their mean.
+            Returns the best parameters (dict), also in self.best, with its
+            cost in self.bestcost."""
+        rng = numpy.random.RandomState(seed)
+        nfree = len(self.free)
+        npop = popsize*nfree
+        assert npop >= 4, "population of less than 4 parameter sets"
+        lo = self.bounds[:,0]
+        span = self.bounds[:,1]-lo
+        P = rng.rand(npop,nfree)
+        cost = self.cost(lo+P*span)
+        self.history = [cost.min()]
+        for it in range(maxiter):
+            r = numpy.array([rng.choice(npop-1,3,replace=False) for i in
+                                                                range(npop)])
+            r += r >= numpy.arange(npop)[:,numpy.newaxis]
+            F = rng.uniform(*mutation)
+            trial = P[r[:,0]]+F*(P[r[:,1]]-P[r[:,2]])
+            cross = rng.rand(npop,nfree) < recombination
+            cross[numpy.arange(npop),rng.randint(nfree,size=npop)] = True
+            trial = numpy.clip(numpy.where(cross,trial,P),0,1)
+            tcost = self.cost(lo+trial*span)
+            better = tcost <= cost
+            P[better] = trial[better]
+            cost[better] = tcost[better]
+            self.history.append(cost.min())
+            finite = cost[numpy.isfinite(cost)]
+            if len(finite) == npop and \
+                                finite.std() <= tol*numpy.abs(finite.mean()):
+                break
+        best = numpy.argmin(cost)
+        self.bestcost = cost[best]
+        self.best = dict(zip(self.free,lo+P[best]*span))
+        return self.best
+
+    def apply(self,mdl=None):
+        """Sets the best parameters in mdl (the fitted model if None)."""
+        if mdl is None:
+            mdl = self.mdl
+        for name in self.best:
+            mdl.__dict__[name] = self.best[name]
+
+    def __repr__(self):
+        return "Fit(" + ", ".join(self.free) + ", " + str(len(self.evals)) + \
+                                                            " evaluations)"
@@ -1,4 +1,5 @@
 import numpy
+import recorder
 import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
@@ -45,7 +46,7 @@ def loadsignal():
         ofile.close()
         dataext='.npz'
     elif sys.argv[1]=='-y':
-        Y=numpy.load(datafile,mmap_mode='r')
+        Y=recorder.loadvm(datafile)
 
         datafile_t = datafile.replace('-Y.npy','-t.npy')
         if datafile_t == datafile:
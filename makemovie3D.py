@@ -1,4 +1,5 @@
 import numpy
+import recorder
 from scipy import io
 import cPickle
 import subprocess
@@ -29,7 +30,7 @@ def loadsignal():
         ofile.close()
         dataext='.npz'
     elif sys.argv[1]=='-y':
-        Y=numpy.load(datafile,mmap_mode='r')
+        Y=recorder.loadvm(datafile)
         datafile_t = datafile.replace('-Y.npy','-t.npy')
         if datafile_t == datafile:
             usage()
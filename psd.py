@@ -0,0 +1,121 @@
+"""Streaming spectral analysis of recorded traces:
+Welch: power spectral density (Welch's method) of many channels, fed chunk by
+    chunk; overlapping windows are processed as they are completed and only
+    running sums are kept (short-time spectra are returned by feed).
+welch: Welch estimate of traces saved by IntGen.save, read by chunks from the
+    memory maps (xcorr.load)."""
+
+import numpy
+from numpy.lib.stride_tricks import as_strided
+import xcorr
+
+class Welch(object):
+    """Welch estimate of the power spectral density.
+        Each window of nperseg samples (hop nperseg-noverlap) has its mean
+        removed, is multiplied by a periodic Hann window and Fourier
+        transformed; the periodograms are summed. The scaling is that of
+        scipy.signal.welch (one-sided density, unit**2/Hz).
+        The power (mean square) of the windows above threshold is also
+        summed, for the burst energy of the signals."""
+
+    def __init__(self,dt,nperseg=256,noverlap=None,threshold=None):
+        """The constructor.
+                dt : time between two samples (ms)
+                nperseg : samples per window
+                noverlap : samples shared by two windows (nperseg/2 if None)
+                threshold : power (unit**2) of the windows counted in the
+                    burst energy, no burst energy if None
+        """
+        if noverlap is None:
+            noverlap = nperseg/2
+        assert 0 <= noverlap < nperseg, "noverlap must be less than nperseg"
+        self.dt = dt
+        self.fs = 1000.0/dt
+        self.nperseg = nperseg
+        self.step = nperseg-noverlap
+        self.window = numpy.hanning(nperseg+1)[:-1]
+        self.freqs = numpy.fft.rfftfreq(nperseg,1/self.fs)
+        self.threshold = threshold
+        self.tail = None
+        self.sum = None
+        self.energy = None
+        self.nwin = 0
+
+    def feed(self,X):
+        """Adds the samples X (one row per channel, consecutive with the
+            previous ones). Returns the spectra of the windows completed
+            (channel, window, frequency), the short-time Fourier transform."""
+        X = numpy.atleast_2d(numpy.asarray(X,float))
+        if self.tail is None:
+            self.tail = numpy.zeros((X.shape[0],0))
+            self.sum = numpy.zeros((X.shape[0],len(self.freqs)))
+            self.energy = numpy.zeros(X.shape[0])
+        assert X.shape[0] == self.tail.shape[0], "incorrect number of channels"
+        buf = numpy.concatenate((self.tail,X),axis=1)
+        n = buf.shape[1]
+        nwin = max((n-self.nperseg)/self.step+1,0)
+        s0,s1 = buf.strides
+        seg = as_strided(buf,(buf.shape[0],nwin,self.nperseg),
+                                                    (s0,self.step*s1,s1))
+        seg = seg - seg.mean(axis=2)[...,numpy.newaxis]
+        if self.threshold is not None:
+            p = (seg**2).mean(axis=2)
+            self.energy += numpy.where(p > self.threshold,p,0).sum(axis=1)
+        F = numpy.fft.rfft(seg*self.window,axis=2)
+        self.sum += (F.real**2+F.imag**2).sum(axis=1)
+        self.nwin += nwin
+        self.tail = buf[:,nwin*self.step:].copy()
+        return F
+
+    def psd(self):
+        """Frequencies (Hz) and power spectral density of each channel."""
+        assert self.nwin > 0, "less samples than one window"
+        P = self.sum/(self.nwin*self.fs*(self.window**2).sum())
+        if self.nperseg%2:
+            P[:,1:] *= 2
+        else:
+            P[:,1:-1] *= 2
+        return self.freqs,P
+
+    def medianfreq(self):
+        """Frequency (Hz) splitting the power of each channel in halves."""
+        f,P = self.psd()
+        c = numpy.cumsum(P,axis=1)
+        i = numpy.argmax(c >= c[:,-1:]/2,axis=1)
+        return f[i]
+
+    def meanfreq(self):
+        """Power-weighted mean frequency (Hz) of each channel."""
+        f,P = self.psd()
+        return (P*f).sum(axis=1)/numpy.maximum(P.sum(axis=1),1e-300)
+
+    def burstenergy(self):
+        """Energy (unit**2.ms) of the bursts of each channel: sum of the
+            power of the windows above threshold, each one counted for its
+            hop (nperseg-noverlap samples)."""
+        assert self.threshold is not None, "no threshold given"
+        return self.energy*self.step*self.dt
+
+    def __repr__(self):
+        return "Welch(nperseg=" + str(self.nperseg) + ", " + \
+                            str(self.nwin) + " windows)"
+
+def welch(filename,coords=None,nperseg=256,noverlap=None,chunk=4096,
+                                                            threshold=None):
+    """Welch estimate of the Vm saved by IntGen.save(filename), read chunk
+        samples at a time.
+            coords : cells analysed (grid coordinates, or indices of the
+                probes/electrodes of a recorder), all the cells if None
+            threshold : window power of the burst energy (see Welch)
+        Returns the Welch object (psd, medianfreq, ...)."""
+    Vm,t = xcorr.load(filename)
+    assert len(t[0]) > 1, "a single sample"
+    w = Welch(float(t[0][1]-t[0][0]),nperseg,noverlap,threshold)
+    for v in Vm:
+        for k in range(0,v.shape[-1],chunk):
+            part = v[...,k:k+chunk]
+            if coords is None:
+                w.feed(part.reshape(-1,part.shape[-1]))
+            else:
+                w.feed(xcorr.traces(part,coords))
+    return w
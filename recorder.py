@@ -0,0 +1,493 @@
+"""Recording of the potential by the integrators:
+Recorder: selection of what is stored every decim steps (whole field, probe
+    points, rectangular region, strided or block-averaged field, or the
+    potentials of virtual electrodes), written in a buffer preallocated by
+    the integrator.
+pointsource: volume conductor kernel of a point current source in an
+    infinite homogeneous medium.
+Quantized: frames stored as int16 or uint8 with a scale and an offset,
+    dequantized when indexed.
+Adaptive: frames recorded on activity (a frame is stored when it differs
+    from the last stored one by more than a tolerance), reconstructed at any
+    time by holding or interpolating the stored frames.
+window: frames of Vm of the same kind (IntGen.save writes long recordings
+    in parts).
+savevm, loadvm: Vm and t written in files (by IntGen.save and the result
+    cache), Vm read back as a memory map of the same kind.
+
+Quantization error: the potentials in vrange are stored within scale/2, i.e.
+1.1e-3 mV in int16 and 0.29 mV in uint8 for the default vrange of 150 mV
+(-100 to 50 mV); potentials outside vrange are clipped.
+
+Adaptive recording: held frames are within the tolerance of the potential
+(plus the quantization error), the history grows with the activity and not
+with the duration (stored frames allocated by blocks of BLOCK frames, except
+in a shared buffer written by another process)."""
+
+import numpy
+import os
+from scipy import sparse
+from conductivity import value
+
+#quantized types: (type, smallest and largest value)
+QTYPES = {'int16':(numpy.int16,-32768,32767),'uint8':(numpy.uint8,0,255)}
+#initial number of stored frames of adaptive recording
+BLOCK = 16
+
+def pointsource(sigma=0.2):
+    """Kernel 1/(4*pi*sigma*r) (sigma: conductivity of the medium, S/m)."""
+    def kernel(r):
+        return 1/(4*numpy.pi*sigma*r)
+    return kernel
+
+class Recorder(object):
+    """Recorded part of the potential.
+        Coordinates are those of the model grid (padding included), a region
+        is given like stimCoord: [x0,x1,y0,y1,z0,z1]. Only one of probes, roi,
+        stride, block and electrodes can be given; without any, the whole
+        field is recorded.
+        Electrodes record the potential created in the volume conductor by
+        the membrane currents of the cells (the axial current divergence,
+        Cm times the diffusion term of the models). The lead field matrix
+        (one row per electrode) includes the Laplacian and is computed once
+        by bind, each frame is then a single matrix product.
+        Quantized frames (any mode) are stored as round((V-offset)/scale),
+        the integrators then give Vm as a Quantized array.
+        Adaptive recording (any mode) stores a frame only when its largest
+        difference with the last stored frame exceeds adaptive (the first
+        frame, and one every keyframes frames, being always stored); the
+        integrators then give Vm as an Adaptive array."""
+
+    def __init__(self,probes=None,roi=None,stride=None,block=None,
+                                    electrodes=None,kernel=None,cutoff=None,
+                                    quantize=None,vrange=(-100.,50.),
+                                    adaptive=None,keyframes=None):
+        """The constructor.
+                probes : list of the grid coordinates of the probe points
+                roi : bounds of a rectangular region
+                stride : steps along each axis (subsampled field)
+                block : block sizes along each axis (field averaged on
+                    blocks, the cells of incomplete blocks are left out)
+                electrodes : (n,3) positions of the electrodes (cm), the
+                    cell (i,j,k) being at (i*hx,j*hy,k*hz)
+                kernel : function of the distance r (cm), potential of a
+                    unit source (pointsource() by default)
+                cutoff : cells further than cutoff (cm) from an electrode
+                    are ignored (sparse lead field) if not None
+                quantize : 'int16' or 'uint8' to store quantized frames
+                vrange : (lowest,highest) potential of the quantized frames
+                adaptive : tolerance (mV) of adaptive recording, every frame
+                    is stored if None
+                keyframes : largest number of frames between two stored
+                    frames (adaptive recording), no limit if None
+        """
+        args = [probes,roi,stride,block,electrodes]
+        assert sum([a is not None for a in args]) <= 1, \
+                                    "only one recording mode can be given"
+        self.mode = 'full'
+        for name,a in zip(['probes','roi','stride','block','electrodes'],args):
+            if a is not None:
+                self.mode = name
+                self.arg = a
+        if kernel is None:
+            kernel = pointsource()
+        self.kernel = kernel
+        self.cutoff = cutoff
+        self.quantize = quantize
+        if quantize is not None:
+            assert quantize in QTYPES, "quantize is 'int16' or 'uint8'"
+            qtype,qmin,qmax = QTYPES[quantize]
+            self.scale = (vrange[1]-vrange[0])/float(qmax-qmin)
+            self.offset = vrange[0]-qmin*self.scale
+        assert adaptive is None or adaptive >= 0, "negative tolerance"
+        assert keyframes is None or keyframes >= 1, "keyframes is at least 1"
+        self.adaptive = adaptive
+        self.keyframes = keyframes
+        self.shape = None
+
+    def bind(self,grid,mdl=None):
+        """Sets the recorder for the grid shape (and the model mdl, needed
+            by electrodes), returns self.
+            self.shape is then the shape of one recorded frame."""
+        self.grid = tuple(grid)
+        n = len(self.grid)
+        if self.mode == 'full':
+            self.shape = self.grid
+        elif self.mode == 'probes':
+            p = numpy.array(self.arg,int).reshape(-1,max(n,1))
+            assert p.shape[1] == n, "probes have incorrect dimensions"
+            assert numpy.all((p >= 0) & (p < numpy.array(self.grid))), \
+                                                    "probes outside the grid"
+            self.index = tuple(p.T)
+            self.shape = (len(p),)
+        elif self.mode == 'roi':
+            assert len(self.arg) == 2*n, "roi has incorrect dimensions"
+            self.sl = tuple([slice(self.arg[2*i],self.arg[2*i+1])
+                                                        for i in range(n)])
+            self.shape = tuple([len(range(*s.indices(g)))
+                                            for s,g in zip(self.sl,self.grid)])
+        elif self.mode == 'stride':
+            assert len(self.arg) == n, "stride has incorrect dimensions"
+            self.sl = tuple([slice(None,None,s) for s in self.arg])
+            self.shape = tuple([(g+s-1)/s for g,s in zip(self.grid,self.arg)])
+        elif self.mode == 'block':
+            assert len(self.arg) == n, "block has incorrect dimensions"
+            self.shape = tuple([g/b for g,b in zip(self.grid,self.arg)])
+            assert min(self.shape) > 0, "blocks are larger than the grid"
+            self.sl = tuple([slice(0,s*b) for s,b in zip(self.shape,self.arg)])
+            self.split = sum([(s,b) for s,b in zip(self.shape,self.arg)],())
+            self.axes = tuple(range(1,2*n,2))
+            self.count = float(numpy.prod(self.arg))
+        elif self.mode == 'electrodes':
+            assert mdl is not None, "electrodes need the model"
+            assert n > 0, "electrodes need a tissue"
+            self.lead = self._lead(mdl)
+            self.shape = (self.lead.shape[0],)
+        return self
+
+    def _lead(self,mdl):
+        """Lead field matrix: potentials of the electrodes (rows) for a unit
+            potential of each cell (columns)."""
+        pos = numpy.asarray(self.arg,float).reshape(-1,3)
+        n = len(self.grid)
+        if mdl.graph is not None:
+            pts = mdl.graph.points
+            rmin = 1e-3
+        else:
+            h = [numpy.mean(value(x)) for x in (mdl.hx,mdl.hy,mdl.hz)][:n]
+            Ra = [numpy.mean(value(x)) for x in (mdl.Rax,mdl.Ray,mdl.Raz)][:n]
+            pts = numpy.zeros((numpy.prod(self.grid),3))
+            pts[:,:n] = numpy.indices(self.grid).reshape(n,-1).T*h
+            rmin = min(h)/2
+            vol = numpy.prod(h)
+        rows = []
+        for e in pos:
+            r = numpy.maximum(numpy.sqrt(((pts-e)**2).sum(axis=1)),rmin)
+            k = self.kernel(r)
+            if self.cutoff is not None:
+                k[r > self.cutoff] = 0
+            if mdl.graph is not None:
+                # membrane currents: L.V
+                src = mdl.graph.L.T.dot(k)
+            else:
+                # membrane currents: sum of 1/(Ra*h**2)*second differences of
+                # V (zero flux at the borders), a symmetric operator
+                k = k.reshape(self.grid)
+                src = numpy.zeros(self.grid)
+                for ax in range(n):
+                    d = numpy.diff(k,axis=ax)/(Ra[ax]*h[ax]**2)
+                    lo = [slice(None)]*n
+                    hi = [slice(None)]*n
+                    lo[ax] = slice(0,-1)
+                    hi[ax] = slice(1,None)
+                    src[tuple(lo)] += d
+                    src[tuple(hi)] -= d
+                src = src.ravel()*vol
+            if self.cutoff is not None:
+                src = sparse.csr_matrix(src)
+            rows.append(src)
+        if self.cutoff is not None:
+            return sparse.vstack(rows).tocsr()
+        return numpy.array(rows)
+
+    def alloc(self,nframes,zeros=numpy.zeros,grow=None):
+        """Buffer of nframes frames (last axis), zeros is the allocation
+            function (shmarray.zeros for the integrators).
+            Adaptive recording stores its frames in its own buffer, of BLOCK
+            frames grown when full if grow, else of nframes frames allocated
+            by zeros (shared, written by another process).
+                grow : default, zeros is numpy.zeros"""
+        assert self.shape is not None, "the recorder is not bound to a grid"
+        dtype = numpy.float
+        if self.quantize is not None:
+            dtype = QTYPES[self.quantize][0]
+        if self.quantize is not None or self.adaptive is not None:
+            self.frame = numpy.empty(self.shape)
+        if self.adaptive is None:
+            return zeros(self.shape+(nframes,),dtype)
+        if grow is None:
+            grow = zeros is numpy.zeros
+        n = nframes
+        if grow:
+            n = min(nframes,BLOCK)
+            zeros = numpy.zeros
+        self.buf = zeros(self.shape+(max(n,1),),dtype)
+        self.frameno = zeros(max(n,1),int)
+        self.count = zeros(1,int)
+        self.last = numpy.empty(self.shape)
+        self.diff = numpy.empty(self.shape)
+        return self.buf
+
+    def wrap(self,Vm,t=None,first=0):
+        """Vm as given by the integrators: Quantized if quantized, Adaptive
+            (built from the stored frames, Vm is then ignored) if adaptive.
+                t : times of the frames of Vm
+                first : number of the first frame of Vm among the recorded
+                    frames"""
+        if self.adaptive is not None:
+            assert t is not None, "adaptive recording needs the times"
+            n = self.count[0]
+            index = numpy.array(self.frameno[:n])-first
+            keep = (index >= 0) & (index < len(t))
+            Vm = self.buf[...,:n][...,keep]
+            index = index[keep]
+        if self.quantize is not None:
+            Vm = Quantized(Vm,self.scale,self.offset)
+        if self.adaptive is not None:
+            Vm = Adaptive(Vm,index,t)
+        return Vm
+
+    def record(self,Y,out,k=None):
+        """Writes the recorded potentials of the state Y (potential in
+            Y[...,0]) in out, a frame of the buffer, or the frame k of out
+            when k is given (needed by adaptive recording)."""
+        if self.adaptive is not None:
+            self._adapt(Y,k)
+            return
+        if k is not None:
+            out = out[...,k]
+        if self.quantize is None:
+            self._record(Y,out)
+            return
+        self._record(Y,self.frame)
+        self._quantize(self.frame,out)
+
+    def _quantize(self,f,out):
+        """Quantized potentials f in out (f is overwritten)."""
+        f -= self.offset
+        f /= self.scale
+        numpy.rint(f,out=f)
+        numpy.clip(f,QTYPES[self.quantize][1],QTYPES[self.quantize][2],out=f)
+        out[...] = f
+
+    def _adapt(self,Y,k):
+        """Stores the frame k of Y if it differs from the last stored frame
+            by more than the tolerance (or after keyframes frames)."""
+        f = self.frame
+        self._record(Y,f)
+        n = self.count[0]
+        if n > 0 and (self.keyframes is None or
+                                    k-self.frameno[n-1] < self.keyframes):
+            numpy.subtract(f,self.last,out=self.diff)
+            numpy.abs(self.diff,out=self.diff)
+            if self.diff.max() <= self.adaptive:
+                return
+        if n == self.buf.shape[-1]:
+            self._grow()
+        self.last[...] = f
+        if self.quantize is None:
+            self.buf[...,n] = f
+        else:
+            self._quantize(f,self.buf[...,n])
+        self.frameno[n] = k
+        self.count[0] = n+1
+
+    def _grow(self):
+        """Doubles the buffer of the stored frames."""
+        n = self.buf.shape[-1]
+        buf = numpy.zeros(self.buf.shape[:-1]+(2*n,),self.buf.dtype)
+        buf[...,:n] = self.buf
+        index = numpy.zeros(2*n,int)
+        index[:n] = self.frameno
+        self.buf = buf
+        self.frameno = index
+
+    def _record(self,Y,out):
+        """Recorded potentials of Y in out."""
+        V = Y[...,0]
+        if self.mode == 'full':
+            out[...] = V
+        elif self.mode == 'probes':
+            out[...] = V[self.index]
+        elif self.mode == 'block':
+            numpy.sum(V[self.sl].reshape(self.split),axis=self.axes,out=out)
+            out /= self.count
+        elif self.mode == 'electrodes':
+            out[...] = self.lead.dot(V.reshape(-1))
+        else:
+            out[...] = V[self.sl]
+
+    def __repr__(self):
+        q = ""
+        if self.quantize is not None:
+            q = ", " + self.quantize + " scale=" + str(self.scale) + \
+                                            " offset=" + str(self.offset)
+        if self.adaptive is not None:
+            q += ", adaptive=" + str(self.adaptive) + "mV"
+            if self.keyframes is not None:
+                q += " keyframes=" + str(self.keyframes)
+        if self.mode == 'full':
+            return "Recorder(full" + q + ")"
+        if self.mode == 'electrodes':
+            return "Recorder(" + str(self.shape[0]) + " electrodes" + q + ")"
+        return "Recorder(" + self.mode + "=" + str(self.arg) + q + ")"
+
+class Quantized(object):
+    """Quantized frames, V = data*scale+offset.
+        Indexing gives the dequantized potentials (float), numpy.asarray the
+        whole dequantized array; data is the stored integer array."""
+
+    def __init__(self,data,scale,offset):
+        """The constructor.
+                data : integer array (or memory map)
+                scale,offset : quantization step and potential of 0 (mV)
+        """
+        self.data = data
+        self.scale = float(scale)
+        self.offset = float(offset)
+
+    shape = property(lambda self: self.data.shape)
+    ndim = property(lambda self: self.data.ndim)
+    size = property(lambda self: self.data.size)
+    nbytes = property(lambda self: self.data.nbytes)
+    dtype = numpy.dtype(float)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self,idx):
+        return self.data[idx]*self.scale+self.offset
+
+    def __array__(self,dtype=None):
+        V = self[...]
+        return V if dtype is None else V.astype(dtype)
+
+    def __repr__(self):
+        return "Quantized(" + str(self.data.dtype) + ", shape=" + \
+                    str(self.shape) + ", scale=" + str(self.scale) + \
+                    ", offset=" + str(self.offset) + ")"
+
+class Adaptive(object):
+    """Frames recorded on activity.
+        frames holds the stored frames (last axis), index their numbers
+        among the frames of the times t. Indexing gives the frames at t as
+        a complete Vm would, at the times of any frame at(time); each frame
+        is reconstructed by holding the last stored frame (interp 'hold'),
+        or by linear interpolation between the stored frames ('linear')."""
+
+    def __init__(self,frames,index,t,interp='hold'):
+        """The constructor.
+                frames : stored frames (array, memory map or Quantized)
+                index : numbers of the stored frames (increasing)
+                t : times of all the frames (ms)
+                interp : 'hold' or 'linear'
+        """
+        assert interp in ('hold','linear'), "interp is 'hold' or 'linear'"
+        assert len(index) > 0, "no stored frame"
+        self.frames = frames
+        self.index = numpy.asarray(index,int)
+        self.t = t
+        self.times = numpy.asarray(t)[self.index]
+        self.interp = interp
+
+    shape = property(lambda self: self.frames.shape[:-1]+(len(self.t),))
+    ndim = property(lambda self: self.frames.ndim)
+    size = property(lambda self: int(numpy.prod(self.shape)))
+    nbytes = property(lambda self: self.frames.nbytes+self.index.nbytes)
+    stored = property(lambda self: len(self.index))
+    dtype = numpy.dtype(float)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def _split(self,idx):
+        """Index of the cells and index of the frames of idx."""
+        if not isinstance(idx,tuple):
+            idx = (idx,)
+        if any([i is Ellipsis for i in idx]):
+            if idx[-1] is Ellipsis:
+                return idx,slice(None)
+            return idx[:-1],idx[-1]
+        if len(idx) == self.ndim:
+            return idx[:-1],idx[-1]
+        return idx,slice(None)
+
+    def _frames(self,cells,i):
+        """Stored frames i (potentials) of the cells."""
+        f = self.frames
+        if isinstance(f,Quantized):
+            return f.data[cells+(slice(None),)][...,i]*f.scale+f.offset
+        return numpy.array(f[cells+(slice(None),)][...,i],float)
+
+    def _at(self,cells,time,frames=None):
+        """Potentials of the cells at time (frames: their numbers)."""
+        if frames is None:
+            i0 = numpy.searchsorted(self.times,time,'right')-1
+        else:
+            i0 = numpy.searchsorted(self.index,frames,'right')-1
+        i0 = numpy.clip(i0,0,self.stored-1)
+        V = self._frames(cells,i0)
+        if self.interp == 'linear':
+            i1 = numpy.minimum(i0+1,self.stored-1)
+            d = self.times[i1]-self.times[i0]
+            w = numpy.clip((time-self.times[i0])/numpy.where(d > 0,d,1.),0,1)
+            V = V+w*(self._frames(cells,i1)-V)
+        return V
+
+    def __getitem__(self,idx):
+        cells,k = self._split(idx)
+        frames = numpy.arange(len(self.t))[k]
+        return self._at(cells,numpy.asarray(self.t)[frames],frames)
+
+    def at(self,time,cells=()):
+        """Potentials at the times time (ms) of the cells (index of the
+            cells, all of them by default)."""
+        if not isinstance(cells,tuple):
+            cells = (cells,)
+        return self._at(cells,numpy.asarray(time,float))
+
+    def window(self,start,stop=None):
+        """Adaptive of the frames start to stop (excluded), the frame held
+            at start being its first stored frame (exact for 'hold')."""
+        start,stop,_ = slice(start,stop).indices(len(self.t))
+        i0 = max(numpy.searchsorted(self.index,start,'right')-1,0)
+        i1 = max(numpy.searchsorted(self.index,stop),i0+1)
+        index = self.index[i0:i1]-start
+        index[0] = 0
+        return Adaptive(window(self.frames,i0,i1),index,
+                                            self.t[start:stop],self.interp)
+
+    def __array__(self,dtype=None):
+        V = self[...]
+        return V if dtype is None else V.astype(dtype)
+
+    def __repr__(self):
+        return "Adaptive(" + str(self.stored) + " of " + str(len(self.t)) + \
+                    " frames stored, shape=" + str(self.shape) + ", " + \
+                    self.interp + ")"
+
+def window(Vm,start,stop=None):
+    """Frames start to stop (excluded) of Vm as given by the integrators,
+        of the same kind (array, Quantized or Adaptive)."""
+    if isinstance(Vm,Adaptive):
+        return Vm.window(start,stop)
+    if isinstance(Vm,Quantized):
+        return Quantized(Vm.data[...,start:stop],Vm.scale,Vm.offset)
+    return Vm[...,start:stop]
+
+def savevm(name,Vm,t):
+    """Writes t and Vm in name-t.npy and name-Y.npy, with the scale and
+        offset of a Quantized Vm in name-q.npy and the numbers of the stored
+        frames of an Adaptive Vm in name-i.npy."""
+    numpy.save(name+'-t.npy',numpy.asarray(t))
+    if isinstance(Vm,Adaptive):
+        numpy.save(name+'-i.npy',Vm.index)
+        Vm = Vm.frames
+    if isinstance(Vm,Quantized):
+        numpy.save(name+'-q.npy',numpy.array([Vm.scale,Vm.offset]))
+        Vm = Vm.data
+    numpy.save(name+'-Y.npy',numpy.asarray(Vm))
+
+def loadvm(yfile,mmap_mode='r'):
+    """Vm of a -Y.npy file written by savevm (IntGen.save), as a memory map
+        (Quantized when the -q.npy file gives its scale and offset, Adaptive
+        when the -i.npy file gives the numbers of the stored frames)."""
+    Vm = numpy.load(yfile,mmap_mode=mmap_mode)
+    base = yfile[:-len('-Y.npy')]
+    if yfile.endswith('-Y.npy') and os.path.exists(base+'-q.npy'):
+        scale,offset = numpy.load(base+'-q.npy')
+        Vm = Quantized(Vm,scale,offset)
+    if yfile.endswith('-Y.npy') and os.path.exists(base+'-i.npy'):
+        Vm = Adaptive(Vm,numpy.load(base+'-i.npy'),
+                            numpy.load(base+'-t.npy',mmap_mode=mmap_mode))
+    return Vm
@@ -0,0 +1,69 @@
+"""Resting state of the cell models:
+restingstate: stable equilibrium of the ionic model of a tissue model (root
+    of the 0D right-hand side, a 0D pre-run when root finding fails), cached
+    per parameter set.
+ionic: 0D right-hand side of a batch of cell states.
+jacobian: Jacobian of the 0D right-hand side (finite differences)."""
+
+import numpy
+from warnings import warn
+
+#resting states already computed, by model class and parameters
+_cache = {}
+
+def _cell(mdl):
+    """0D model of the class of mdl, with its scalar parameters."""
+    cell = mdl.__class__(0)
+    for par in mdl.parlist:
+        v = mdl.__dict__[par]
+        if isinstance(v,(int,long,float,str)) and not isinstance(v,bool):
+            cell.__dict__[par] = v
+    return cell
+
+def _key(cell):
+    """Key of the parameter set of cell in _cache."""
+    return (cell.__class__.__name__,) + tuple(sorted([(par,cell.__dict__[par])
+                for par in cell.parlist if par in cell.__dict__ and
+                isinstance(cell.__dict__[par],(int,long,float,str))]))
+
+def ionic(cell,Y):
+    """Time derivative (no stimulation) of the states Y (one per row) of the
+        0D model cell."""
+    cell.Y = numpy.array(Y,float).reshape(-1,cell.dim)
+    cell.dY = numpy.empty(cell.Y.shape)
+    cell.Istim = numpy.zeros(())
+    cell.derivT(0,MP=True)
+    return cell.dY
+
+def jacobian(cell,y):
+    """Jacobian of ionic at the state y (all the perturbed states are
+        evaluated at once)."""
+    h = 1e-7*numpy.maximum(numpy.abs(y),1e-6)
+    Y = numpy.tile(y,(len(y)+1,1))
+    Y[1:] += numpy.diag(h)
+    dY = ionic(cell,Y)
+    return ((dY[1:]-dY[0])/h[:,numpy.newaxis]).T
+
+def restingstate(mdl,tmax=5000,dt=0.05):
+    """Resting state (one cell) for the parameters of the model mdl.
+        The root of the right-hand side closest to the default initial state
+        is kept if the Jacobian there is stable; otherwise the cell is
+        integrated from the default initial state during tmax (ms)."""
+    cell = _cell(mdl)
+    key = _key(cell)
+    if key not in _cache:
+        from scipy import optimize
+        y0 = numpy.array(cell.Y,float)
+        sol = optimize.root(lambda y: ionic(cell,y)[0],y0,
+                            jac=lambda y: jacobian(cell,y),method='hybr')
+        y = sol.x
+        ok = sol.success and numpy.all(y[1:] > 0) and \
+            numpy.all(numpy.linalg.eigvals(jacobian(cell,y)).real < 0)
+        if not ok:
+            warn('no stable resting state found by root finding: 0D pre-run')
+            Y = y0[numpy.newaxis].copy()
+            for k in range(int(round(tmax/dt))):
+                Y += ionic(cell,Y)*dt
+            y = Y[0]
+        _cache[key] = y
+    return _cache[key].copy()
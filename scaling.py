@@ -0,0 +1,174 @@
+"""Parallel scaling of the integrators.
+Strong scaling: fixed global grid, 1..N processes.
+Weak scaling: fixed grid per process (the grid grows along X, the axis
+split between the processes).
+IntParaMP is run for each number of processes; for strong scaling, IntPara
+is also run on the engines of a running ipcluster (profile mpi) when one is
+available (its number of processes is the number of engines). Speedup,
+parallel efficiency, time waiting in synchronisation and halo volume are
+saved as a table (.txt), JSON (.json) and, with matplotlib, a plot (.png)."""
+
+import cell_mdl
+import numpy
+import multiprocessing as mp
+import json
+import sys
+
+def usage():
+    print "Usage:"
+    print "Strong scaling :\n\t"+sys.argv[0]+" -s Red3 200x200 results [tmax]"
+    print "Weak scaling :\n\t"+sys.argv[0]+" -w Red3 100x200 results [tmax]"
+    print "    (grid of each process for weak scaling)"
+    print "Optional argument : tmax, simulated time in ms (default 20)"
+
+def halo(shape,nbx,nby=0):
+    """Number of potentials exchanged per step by a decomposition of the
+        grid shape in nbx rows (and nby columns): each interface is read
+        from both sides."""
+    cells = 2*(nbx-1)*numpy.prod(shape[1:])
+    if nby and len(shape) > 1:
+        cells += 2*(nby-1)*shape[0]*numpy.prod(shape[2:])
+    return int(cells)
+
+def _model(name,shape):
+    """Model of class name, shape is the grid without padding."""
+    return getattr(cell_mdl,name)(*shape)
+
+def _run(intg,tmax):
+    """Instrumented compute, returns the phase summary."""
+    intg.instrument()
+    intg.compute(tmax)
+    return intg.timing
+
+def _row(mode,backend,N,shape,padded,summary,nbx,nby=0):
+    d = {'mode':mode,'backend':backend,'N':N,
+        'shape':'x'.join([str(n) for n in shape]),
+        'wall':summary['wall'],
+        # counters are summed over the processes
+        'sync':summary['sync']/N,
+        'sync_share':summary['sync']/(N*summary['wall']),
+        'halo':halo(padded,nbx,nby),
+        'halo_MB':halo(padded,nbx,nby)*8*summary['steps']/2.**20,
+        'updates_per_s':summary['updates_per_s']}
+    return d
+
+def _mpi(name,shape,tmax,mode):
+    """Row of IntPara, None if no cluster is running."""
+    if not cell_mdl.hasmpi():
+        return None
+    try:
+        intg = cell_mdl.IntPara(_model(name,shape))
+    except Exception, e:
+        print 'IntPara not available : ' + str(e)
+        return None
+    mdl = intg.mdl
+    summary = _run(intg,tmax)
+    N = max(1,intg.nbx)*max(1,intg.nby)
+    return _row(mode,'IntPara',N,shape,mdl.Y.shape[:-1],summary,intg.nbx,
+                                                                    intg.nby)
+
+def strong(name,shape,procs=None,tmax=20):
+    """Strong scaling of the grid shape over the numbers of processes procs
+        (1..cpu_count by default)."""
+    if procs is None:
+        procs = range(1,mp.cpu_count()+1)
+    rows = []
+    for N in procs:
+        mdl = _model(name,shape)
+        intg = cell_mdl.IntParaMP(mdl,N)
+        summary = _run(intg,tmax)
+        rows.append(_row('strong','IntParaMP',intg.N,shape,mdl.Y.shape[:-1],
+                                                            summary,intg.N))
+    r = _mpi(name,shape,tmax,'strong')
+    if r is not None:
+        rows.append(r)
+    return _speedup(rows,weak=False)
+
+def weak(name,shape,procs=None,tmax=20):
+    """Weak scaling, shape is the grid of each process."""
+    if procs is None:
+        procs = range(1,mp.cpu_count()+1)
+    rows = []
+    for N in procs:
+        shp = [shape[0]*N] + list(shape[1:])
+        mdl = _model(name,shp)
+        intg = cell_mdl.IntParaMP(mdl,N)
+        summary = _run(intg,tmax)
+        rows.append(_row('weak','IntParaMP',intg.N,shp,mdl.Y.shape[:-1],
+                                                            summary,intg.N))
+    return _speedup(rows,weak=True)
+
+def _speedup(rows,weak):
+    """Adds speedup and efficiency, relative to the 1 process run."""
+    ref = [r for r in rows if r['N'] == 1 and r['backend'] == 'IntParaMP']
+    for r in rows:
+        if not ref:
+            r['speedup'] = r['efficiency'] = numpy.nan
+        elif weak:
+            r['efficiency'] = ref[0]['wall']/r['wall']
+            r['speedup'] = r['efficiency']*r['N']
+        else:
+            r['speedup'] = ref[0]['wall']/r['wall']
+            r['efficiency'] = r['speedup']/r['N']
+    return rows
+
+COLUMNS = ['backend','N','shape','wall','speedup','efficiency','sync',
+                                        'sync_share','halo','halo_MB']
+
+def table(rows):
+    """Text table of the results."""
+    lines = ['\t'.join(COLUMNS)]
+    for r in rows:
+        lines.append('\t'.join([isinstance(r[c],float) and '%.4g' % r[c] or
+                                                str(r[c]) for c in COLUMNS]))
+    return '\n'.join(lines)
+
+def save(rows,filename):
+    """Saves the table, the JSON results and the plot (if possible)."""
+    f = open(filename+'.txt','w')
+    f.write(table(rows)+'\n')
+    f.close()
+    f = open(filename+'.json','w')
+    json.dump(rows,f,indent=1,sort_keys=True)
+    f.close()
+    try:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+    except ImportError:
+        return
+    mp_rows = [r for r in rows if r['backend'] == 'IntParaMP']
+    N = [r['N'] for r in mp_rows]
+    fig = plt.figure(figsize=(10,4))
+    ax = fig.add_subplot(131)
+    ax.plot(N,[r['speedup'] for r in mp_rows],'o-',label='IntParaMP')
+    ax.plot(N,N,'k--',label='ideal')
+    ax.set_xlabel('processes')
+    ax.set_ylabel('speedup')
+    ax.legend(loc='upper left')
+    ax = fig.add_subplot(132)
+    ax.plot(N,[r['efficiency'] for r in mp_rows],'o-')
+    ax.set_xlabel('processes')
+    ax.set_ylabel('efficiency')
+    ax = fig.add_subplot(133)
+    ax.plot(N,[r['sync_share'] for r in mp_rows],'o-')
+    ax.set_xlabel('processes')
+    ax.set_ylabel('share of time in sync')
+    fig.tight_layout()
+    fig.savefig(filename+'.png')
+
+if __name__ == '__main__':
+    if len(sys.argv) < 5 or sys.argv[1] not in ('-s','-w'):
+        usage()
+        sys.exit(2)
+    shape = [int(n) for n in sys.argv[3].split('x')]
+    if len(sys.argv) == 6:
+        tmax = float(sys.argv[5])
+    else:
+        tmax = 20
+    if sys.argv[1] == '-s':
+        rows = strong(sys.argv[2],shape,tmax=tmax)
+    else:
+        rows = weak(sys.argv[2],shape,tmax=tmax)
+    print table(rows)
+    save(rows,sys.argv[4])
@@ -0,0 +1,55 @@
+"""Spectral diffusion:
+SpectralDiffusion: exact diffusion step along a periodic axis (FFT, decay of
+    each mode, inverse FFT), used by cylindrical models in place of the
+    stencil along Y."""
+
+import numpy
+
+class SpectralDiffusion(object):
+    """Exact diffusion along a periodic axis.
+        Each Fourier mode m of the discrete Laplacian [1,-2,1] decays as
+        exp(-D*k2[m]*dt), with k2[m] = 4*sin(pi*m/n)**2 (modified
+        wavenumber), so the step is unconditionally stable and consistent
+        with the stencil used along the other axes. D may vary from row to
+        row (a field constant along the periodic axis), each row then
+        decays with its own D."""
+
+    def __init__(self,n,axis=1):
+        """The constructor.
+                n : number of cells along the periodic axis
+                axis : periodic axis of the potential array
+        """
+        self.n = n
+        self.axis = axis
+        self.k2 = 4*numpy.sin(numpy.pi*numpy.arange(n/2+1)/n)**2
+        self.cache = {}
+
+    def decay(self,D,dt,ndim):
+        """Decay factors of the modes for D and dt (cached for a scalar D,
+            recomputed for a field)."""
+        if numpy.ndim(D) > 0:
+            D = numpy.asarray(D)
+            assert D.ndim == ndim, "D has incorrect dimensions"
+            row = D.take([0],axis=self.axis)
+            assert (D == row).all(), \
+                        "D must be constant along the periodic axis"
+            shp = [1]*ndim
+            shp[self.axis] = len(self.k2)
+            return numpy.exp(-row*self.k2.reshape(shp)*dt)
+        key = (float(D),float(dt),ndim)
+        if key not in self.cache:
+            if len(self.cache) > 8:
+                self.cache.clear()
+            shp = [1]*ndim
+            shp[self.axis] = len(self.k2)
+            self.cache[key] = numpy.exp(-D*self.k2*dt).reshape(shp)
+        return self.cache[key]
+
+    def step(self,V,D,dt):
+        """Diffuses V along the periodic axis during dt (in place)."""
+        f = self.decay(D,dt,V.ndim)
+        V[...] = numpy.fft.irfft(numpy.fft.rfft(V,axis=self.axis)*f,
+                                                        n=self.n,axis=self.axis)
+
+    def __repr__(self):
+        return "SpectralDiffusion(" + str(self.n) + " cells)"
@@ -0,0 +1,130 @@
+"""Stimulation protocols:
+StimProtocol: any number of stimulation sites, each one driven by a
+    precomputed waveform.
+halfsine, pulsetrain, ramp, trace: waveform generators (functions of the time
+    vector)."""
+
+import numpy
+
+def halfsine(t,Iamp,tmax):
+    """Half-sine of amplitude Iamp over [0,tmax] (default waveform of the
+        integrators)."""
+    s = numpy.sin(2*numpy.pi*t/(2*tmax))
+    return Iamp/2*(numpy.sign(s)+1)*s
+
+def pulsetrain(t,Iamp,period,width,delay=0,npulses=None):
+    """Rectangular pulses of amplitude Iamp lasting width ms, every period ms,
+        starting at delay."""
+    tr = t-delay
+    w = Iamp*((tr>=0)&(numpy.mod(tr,period)<width))
+    if npulses is not None:
+        w[tr>=npulses*period] = 0
+    return w.astype(float)
+
+def ramp(t,Iamp,t0,t1):
+    """Linear ramp from 0 at t0 to Iamp at t1, constant afterwards."""
+    return Iamp*numpy.clip((t-t0)/float(t1-t0),0,1)
+
+def trace(t,tr,values):
+    """Recorded trace (tr,values) resampled on t, 0 outside of tr."""
+    return numpy.interp(t,tr,values,left=0,right=0)
+
+def boxindex(shape,coord):
+    """Flat indices of the box coord=[x0,x1,y0,y1,z0,z1] in a grid of given
+        shape."""
+    ax = [numpy.arange(shape[i])[coord[2*i]:coord[2*i+1]]
+                                                for i in range(len(coord)/2)]
+    return numpy.ravel_multi_index(numpy.ix_(*ax),shape).ravel()
+
+
+class StimProtocol(object):
+    """Stimulation sites and their waveforms.
+        Once built on the time vector of the integration, applying the
+        protocol at step k costs one scatter into Istim. A cell belonging to
+        several sites takes the current of the last one added (the sites are
+        assigned in turn)."""
+
+    def __init__(self,shape):
+        """The constructor.
+                shape : shape of the Istim array of the model
+        """
+        self.shape = tuple(shape)
+        self.sites = []
+        self.waves = []
+        self.index = numpy.zeros(0,int)
+
+    def addsite(self,site,wave):
+        """Adds a stimulation site.
+                site : flat indices (array), boolean mask of shape self.shape
+                    or box coordinates (list [x0,x1,y0,y1,z0,z1])
+                wave : array (one value per time step) or function of the
+                    time vector
+        """
+        if isinstance(site,(list,tuple)):
+            site = boxindex(self.shape,site)
+        site = numpy.asarray(site)
+        if site.dtype == bool:
+            assert site.shape == self.shape, "mask has incorrect dimensions"
+            site = numpy.flatnonzero(site)
+        self.sites.append(numpy.asarray(site,int).ravel())
+        self.waves.append(wave)
+
+    def build(self,t):
+        """Precomputes the waveforms on the time vector t and the mapping from
+            sites to stimulated cells."""
+        nsteps = len(t)
+        self.W = numpy.zeros((nsteps,len(self.sites)))
+        for i,w in enumerate(self.waves):
+            if callable(w):
+                self.W[:,i] = w(t)
+            else:
+                w = numpy.asarray(w,float)
+                n = min(nsteps,len(w))
+                self.W[:n,i] = w[:n]
+        if self.sites:
+            allidx = numpy.concatenate(self.sites)
+        else:
+            allidx = numpy.zeros(0,int)
+        self.index = numpy.unique(allidx)
+        # last site of each cell
+        owner = numpy.zeros(len(self.index),int)
+        for i,s in enumerate(self.sites):
+            owner[numpy.searchsorted(self.index,s)] = i
+        self.weight = numpy.zeros((len(self.index),len(self.sites)))
+        self.weight[numpy.arange(len(self.index)),owner] = 1
+        self.active = (self.W != 0).any(axis=1)
+        # stimulated cells kept uncoupled until the first step after the
+        # start where no site is active
+        self.hold = numpy.logical_and.accumulate(
+                                    numpy.r_[True,self.active[1:]])
+        return self
+
+    def apply(self,Istim,k):
+        """Writes the stimulation currents of step k into Istim, returns True
+            while the stimulated cells are kept uncoupled (from the start
+            until a step where no site is active)."""
+        k = min(k,len(self.active)-1)
+        if len(self.index):
+            Istim.flat[self.index] = numpy.dot(self.weight,self.W[k])
+        return self.hold[k]
+
+    def local(self,lims):
+        """Protocol restricted to a subdomain, with local flat indices.
+                lims : [(x0,x1),(y0,y1),...] limits of the subdomain along
+                    the first axes (global coordinates)
+        """
+        shape = list(self.shape)
+        sub = numpy.unravel_index(self.index,self.shape)
+        keep = numpy.ones(len(self.index),bool)
+        loc = list(sub)
+        for ax,(a,b) in enumerate(lims):
+            keep &= (sub[ax]>=a)&(sub[ax]<b)
+            loc[ax] = sub[ax]-a
+            shape[ax] = b-a
+        p = StimProtocol(shape)
+        p.index = numpy.ravel_multi_index([l[keep] for l in loc],shape)
+        p.weight = self.weight[keep]
+        p.W = self.W
+        p.active = self.active
+        p.hold = self.hold
+        return p
@@ -0,0 +1,49 @@
+#Allocation budget of the time loop, in bytes of the potential field per step
+#Fails (AssertionError) when a change allocates more than the budget
+
+import cell_mdl
+import allocation
+import multiprocessing as mp
+import shmarray
+import numpy
+
+#temporaries of one step (peak), in number of potential fields
+PEAK = {'Red3':26,'Red6':40,'IntSerial':28,'parallelcompMP':32}
+#memory kept after each step, in bytes
+RETAINED = 256
+
+def check(name,d,field):
+    print '%-16s %-10s peak %6.1f fields, retained %6.1f bytes/step' % (name,
+                                d['backend'],d['peak']/field,d['retained'])
+    assert d['peak'] <= PEAK[name]*field, name + " exceeds its peak budget"
+    assert d['retained'] <= RETAINED, name + " keeps memory at each step"
+
+for shape in [(50,50),(12,12,12)]:
+    print 'grid', shape
+    for name in ['Red3','Red6']:
+        mdl = getattr(cell_mdl,name)(*shape)
+        field = float(mdl.Y[...,0].nbytes)
+        check(name,allocation.measure(lambda: mdl.derivT(0.05)),field)
+
+    #serial integrator (whole loop, records included)
+    mdl = cell_mdl.Red3(*shape)
+    intg = cell_mdl.IntSerial(mdl)
+    intg.compute(1)
+    check('IntSerial',allocation.steps(lambda: intg.compute(10),200),field)
+
+    #loop of the IntParaMP processes, run here with one process
+    mdl = cell_mdl.Red3(*shape)
+    intg = cell_mdl.IntParaMP(mdl,1)
+    intg.dt = 0.05
+    tmax = 10
+    protocol = intg._protocol(tmax,0,mdl.stimCoord,mdl.stimCoord2)
+    Vm = shmarray.zeros(list(mdl.Y.shape[:-1])+[round(tmax/(intg.dt*20))+1])
+    t = shmarray.zeros(Vm.shape[-1])
+    Ny = getattr(mdl,'Ny',0)
+    Nz = getattr(mdl,'Nz',0)
+    def f():
+        cell_mdl.parallelcompMP(0,tmax,mdl.Nx,Ny,Nz,1,protocol,
+            mdl.getlistparams(),intg.dt,intg.Y,mdl.mask,mp.Value('i',0),Vm,t,
+            mp.Semaphore(1),mp.Semaphore(0))
+    f()
+    check('parallelcompMP',allocation.steps(f,200),field)
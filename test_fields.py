@@ -0,0 +1,33 @@
+#Spatially varying parameters in the IntParaMP processes: two processes
+#against one, with Cm as a ParamField and with the conductivity stencil
+#Fails (AssertionError) when the processes do not get their slab of a field
+
+import cell_mdl
+import conductivity
+import numpy
+
+#largest difference between one and two processes (mV), the rows shared by
+#the processes being exchanged without synchronization at every step
+TOLERANCE = 1.0
+
+def run(N,cond):
+    mdl = cell_mdl.Red3(40,12)
+    Cm = numpy.ones(mdl.Y.shape[:-1])
+    Cm[:mdl.Y.shape[0]/2] = 1.2
+    mdl.Cm = conductivity.ParamField(Cm)
+    if cond:
+        Rax = numpy.linspace(4500,9000,mdl.Y.shape[0])[:,numpy.newaxis]
+        mdl.Rax = conductivity.ParamField(Rax*numpy.ones(mdl.Y.shape[:-1]))
+        mdl.setconductivity()
+    intg = cell_mdl.IntParaMP(mdl,1)
+    #N processes even with fewer CPUs
+    intg.N = N
+    intg.compute(20,[2,10,2,10],[0,0,0,0])
+    return intg.Vm[...,1:]
+
+for cond in [False,True]:
+    V1 = run(1,cond)
+    V2 = run(2,cond)
+    err = abs(V2-V1).max()
+    print 'conductivity %-5s |V(N=2)-V(N=1)| %.3g mV' % (cond,err)
+    assert V2.min() < -40 and err <= TOLERANCE, "field parameters not sliced"
@@ -0,0 +1,16 @@
+#Import time budget of cell_mdl (optional backends are imported on first use)
+#Fails (AssertionError) when import cell_mdl gets slower than the budget
+
+import bench
+import sys
+
+#seconds
+BUDGET = 0.5
+
+dt = bench.importtime('cell_mdl')
+print 'import cell_mdl : %.3f s (budget %.3f s)' % (dt,BUDGET)
+assert dt <= BUDGET, "import cell_mdl exceeds its time budget"
+#the optional backends must not be imported with cell_mdl
+import cell_mdl
+for name in ['IPython','enthought','pylab','matplotlib','scipy.signal']:
+    assert name not in sys.modules, name + " is imported with cell_mdl"
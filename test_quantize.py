@@ -0,0 +1,29 @@
+#Quantized recording in the shared buffer of IntParaMP: every frame, the
+#initial one included, matches the full recording within the quantization
+#error (int16, uint8, and uint8 with adaptive recording)
+#Fails (AssertionError) when a frame is left at the offset of the quantization
+
+import cell_mdl
+import recorder
+import numpy
+
+#largest error (mV): quantization step/2 (and the adaptive tolerance)
+TOLERANCE = {'int16':1.2e-3,'uint8':0.3}
+
+def run(**opts):
+    mdl = cell_mdl.Red3(30,8)
+    V0 = mdl.Y[...,0].copy()
+    intg = cell_mdl.IntParaMP(mdl,1)
+    intg.compute(10,[2,6,2,6],[0,0,0,0],recorder=recorder.Recorder(**opts))
+    return V0,numpy.asarray(intg.Vm)
+
+V0,Vfull = run()
+assert abs(Vfull[...,0]-V0).max() == 0, "initial frame not recorded"
+for opts in [{'quantize':'int16'},{'quantize':'uint8'},
+                                        {'quantize':'uint8','adaptive':0.5}]:
+    tol = TOLERANCE[opts['quantize']]+opts.get('adaptive',0)
+    V = run(**opts)[1]
+    err0 = abs(V[...,0]-V0).max()
+    err = abs(V-Vfull).max()
+    print '%-40s |V0-Vm[0]| %.3g mV, |V-Vfull| %.3g mV' % (opts,err0,err)
+    assert err0 <= tol and err <= tol, "frame not recorded"
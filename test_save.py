@@ -0,0 +1,46 @@
+#IntGen.save of long recordings: above limitsize the recording is written in
+#parts, read back by xcorr.load (recorder.loadvm) as the frames of the whole
+#recording (full, quantized and adaptive recording)
+#Fails (AssertionError) when a part loses its kind or its frames
+
+import cell_mdl
+import recorder
+import xcorr
+import numpy
+import warnings
+import tempfile
+import shutil
+import os
+
+#limit of a file (whole MB, 0: parts under 1 MB) and duration of a part (ms,
+#halved until the parts fit): the recordings of 1.5 to 16 MB are split
+LIMIT = 0
+TMAX = 10
+
+def kind(Vm):
+    """Quantized, Adaptive or array (memory map)."""
+    if isinstance(Vm,(recorder.Quantized,recorder.Adaptive)):
+        return Vm.__class__
+    return numpy.ndarray
+
+warnings.simplefilter('ignore')
+tmp = tempfile.mkdtemp()
+try:
+    for n,opts in enumerate([{},{'quantize':'int16'},{'adaptive':0.05},
+                                    {'quantize':'uint8','adaptive':0.05}]):
+        intg = cell_mdl.IntSerial(cell_mdl.Red3(160,160))
+        intg.compute(40,[2,40,2,40],[0,0,0,0],
+                                        recorder=recorder.Recorder(**opts))
+        name = os.path.join(tmp,'run%d' % n)
+        intg.save(name,LIMIT,TMAX)
+        Vm,t = xcorr.load(name)
+        assert len(Vm) > 1, "not written in parts"
+        V = numpy.concatenate([numpy.asarray(v) for v in Vm],-1)
+        t = numpy.concatenate(t)
+        err = abs(V-numpy.asarray(intg.Vm)).max()
+        print '%-40s %2d parts %-10s |V-Vm| %.3g mV' % (opts,len(Vm),
+                                                    kind(Vm[0]).__name__,err)
+        assert kind(Vm[0]) is kind(intg.Vm), "part of another kind"
+        assert (t == intg.t).all() and err == 0, "frames lost in the parts"
+finally:
+    shutil.rmtree(tmp)
@@ -0,0 +1,25 @@
+#Spectral diffusion along Y with the conductivity stencil: the result must not
+#depend on the order of setconductivity and setspectral, and stay close to the
+#finite difference stencil
+#Fails (AssertionError) when the Y diffusion is counted twice
+
+import cell_mdl
+import numpy
+
+#largest difference to the finite difference stencil (mV)
+TOLERANCE = 0.1
+
+def run(order):
+    mdl = cell_mdl.Red3(20,16,cylindrical=True)
+    for step in order:
+        getattr(mdl,step)()
+    intg = cell_mdl.IntSerial(mdl)
+    intg.compute(20,[2,6,0,5],[0,0,0,0])
+    return intg.Vm[...,-1]
+
+ref = run(['setconductivity'])
+for order in [['setconductivity','setspectral'],
+                                    ['setspectral','setconductivity']]:
+    err = abs(run(order)-ref).max()
+    print '%-32s |V-Vstencil| %.3g mV' % (' then '.join(order),err)
+    assert err <= TOLERANCE, "Y diffusion counted twice"
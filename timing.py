@@ -0,0 +1,85 @@
+"""Hot path instrumentation:
+PhaseTimer: cumulative wall-clock time of the phases of the time loop
+    (ionic update, diffusion, stimulation, recording, synchronisation,
+    input/output), switched off by default. The wait of the parent process
+    for the engines is kept apart, their own phases already cover it."""
+
+import numpy
+from time import time as clock
+
+class PhaseTimer(object):
+    """Cumulative wall-clock counters.
+        t = timer.tic() ... t = timer.toc('ionic',t) adds the elapsed time to
+        a phase; a disabled timer only costs two function calls per phase."""
+
+    phases = ('ionic','diffusion','stimulus','record','sync','io','wait')
+    #phases left out of the total (time spent by other processes)
+    apart = ('wait',)
+
+    def __init__(self,enabled=False):
+        """The constructor.
+                enabled : counters are updated
+        """
+        self.enabled = enabled
+        self.reset()
+
+    def reset(self):
+        """Sets the counters to 0."""
+        self.total = dict((p,0.0) for p in self.phases)
+        self.steps = 0
+        self.cells = 0
+        self.wall = 0.0
+
+    def tic(self):
+        """Current time (0 if disabled)."""
+        if self.enabled:
+            return clock()
+        return 0
+
+    def toc(self,phase,t0):
+        """Adds the time elapsed since t0 to phase, returns the current time."""
+        if self.enabled:
+            t = clock()
+            self.total[phase] += t-t0
+            return t
+        return 0
+
+    def tovector(self):
+        """Counters as an array (to be shared between processes)."""
+        return numpy.array([self.total[p] for p in self.phases] + [self.steps])
+
+    def fromvector(self,v):
+        """Adds the counters stored by tovector."""
+        for i,p in enumerate(self.phases):
+            self.total[p] += v[i]
+        self.steps = max(self.steps,int(v[len(self.phases)]))
+
+    def summary(self):
+        """Counters, wall time and cell updates per second as a dict."""
+        d = dict(self.total)
+        d['wall'] = self.wall
+        d['steps'] = self.steps
+        d['cells'] = self.cells
+        if self.wall > 0:
+            d['updates_per_s'] = self.cells*self.steps/self.wall
+        else:
+            d['updates_per_s'] = 0.0
+        return d
+
+def report(d):
+    """Text report of a summary dict."""
+    lines = []
+    phases = [p for p in PhaseTimer.phases if p not in PhaseTimer.apart]
+    tot = sum([d[p] for p in phases])
+    for p in phases:
+        if tot > 0:
+            share = 100*d[p]/tot
+        else:
+            share = 0.0
+        lines.append('%14s : %9.3f s (%5.1f %%)' % (p,d[p],share))
+    for p in PhaseTimer.apart:
+        lines.append('%14s : %9.3f s' % (p,d[p]))
+    lines.append('%14s : %9.3f s' % ('wall',d['wall']))
+    lines.append('%14s : %d x %d' % ('cells x steps',d['cells'],d['steps']))
+    lines.append('%14s : %.4g' % ('cell updates/s',d['updates_per_s']))
+    return '\n'.join(lines)
@@ -0,0 +1,103 @@
+"""Cell graph topology:
+TissueGraph: tissue given as a point set and a sparse conductance matrix,
+    reordered for memory locality. Used by the models (graph argument) to
+    simulate irregular geometries without masked-out cells.
+fromgrid: builds the graph of the cells selected by a boolean mask of a
+    regular grid."""
+
+import numpy
+from scipy import sparse
+from scipy.sparse.csgraph import reverse_cuthill_mckee
+
+class TissueGraph(object):
+    """Cells and their connections.
+        The cells are renumbered with the reverse Cuthill-McKee ordering;
+        perm[i] is the original number of cell i and iperm the inverse
+        permutation."""
+
+    def __init__(self,points,conductance,reorder=True):
+        """The constructor.
+                points : (N,3) array of cell positions (cm)
+                conductance : (N,N) sparse symmetric matrix, conductance
+                    between connected cells (1/(Ra*h**2)), the diagonal is
+                    ignored
+                reorder : renumbers the cells to reduce the bandwidth
+        """
+        G = sparse.csr_matrix(conductance,dtype=float)
+        assert G.shape[0] == G.shape[1] == len(points), \
+                                "points and conductance have incorrect sizes"
+        G = (G - sparse.diags(G.diagonal(),0)).tocsr()
+        G.eliminate_zeros()
+        if reorder:
+            self.perm = reverse_cuthill_mckee(G,symmetric_mode=True)
+        else:
+            self.perm = numpy.arange(G.shape[0])
+        self.perm = numpy.asarray(self.perm,int)
+        self.iperm = numpy.empty_like(self.perm)
+        self.iperm[self.perm] = numpy.arange(len(self.perm))
+        self.ncells = len(self.perm)
+        self.points = numpy.asarray(points,float)[self.perm]
+        self.G = G[self.perm][:,self.perm].tocsr()
+        #Laplacian: sum_j g_ij*(V_j-V_i)
+        self.L = (self.G - sparse.diags(numpy.asarray(self.G.sum(axis=1))
+                                                            .ravel(),0)).tocsr()
+
+    def cells(self,ids):
+        """Graph indices of the cells given by their original numbers."""
+        return self.iperm[numpy.asarray(ids,int)]
+
+    def unpermute(self,V):
+        """Values in the original cell order (first axis of V)."""
+        return V[self.iperm,...]
+
+    def bandwidth(self):
+        """Maximum distance between the indices of two connected cells."""
+        G = self.G.tocoo()
+        if not G.nnz:
+            return 0
+        return int(abs(G.row-G.col).max())
+
+    def rows(self,a,b):
+        """Graph restricted to the cells a to b (the Laplacian keeps all the
+            columns: the diffusion reads the potentials of all the cells).
+            perm and iperm still refer to the whole graph."""
+        g = TissueGraph.__new__(TissueGraph)
+        g.__dict__.update(self.__dict__)
+        g.L = self.L[a:b]
+        g.points = self.points[a:b]
+        g.ncells = b-a
+        g.offset = a
+        return g
+
+    def __repr__(self):
+        return "TissueGraph(" + str(self.ncells) + " cells)"
+
+def fromgrid(mask,hx=0.03,hy=0.03,hz=0.03,Rax=4500,Ray=4500,Raz=4500):
+    """Graph of the cells of a regular grid selected by mask.
+            mask : boolean array (1D, 2D or 3D) of the tissue cells
+            hx,hy,hz : cell sizes (cm)
+            Rax,Ray,Raz : axial resistances
+        Returns the graph and the grid indices of its cells (original order).
+    """
+    mask = numpy.asarray(mask,bool)
+    grid = numpy.argwhere(mask)
+    num = -numpy.ones(mask.shape,int)
+    num[mask] = numpy.arange(len(grid))
+    h = [hx,hy,hz][:mask.ndim]
+    Ra = [Rax,Ray,Raz][:mask.ndim]
+    rows,cols,vals = [],[],[]
+    for ax in range(mask.ndim):
+        n = mask.shape[ax]
+        a = numpy.rollaxis(num,ax)[:n-1]
+        b = numpy.rollaxis(num,ax)[1:]
+        link = (a>=0)&(b>=0)
+        g = 1./(Ra[ax]*h[ax]**2)
+        rows.extend([a[link],b[link]])
+        cols.extend([b[link],a[link]])
+        vals.append(g*numpy.ones(2*link.sum()))
+    N = len(grid)
+    G = sparse.coo_matrix((numpy.concatenate(vals),(numpy.concatenate(rows),
+                                    numpy.concatenate(cols))),shape=(N,N))
+    points = numpy.zeros((N,3))
+    points[:,:mask.ndim] = grid*numpy.array(h)
+    return TissueGraph(points,G),grid
@@ -0,0 +1,83 @@
+"""Batched delay estimation by cross-correlation:
+load: Vm saved by IntGen.save, as memory maps (one per saved file).
+traces: time series of a list of cells, read from arrays or memory maps.
+delays: delays between pairs of traces, from the peak of their
+    cross-correlation (FFT of all the traces at once, parabolic
+    interpolation of the peak)."""
+
+import numpy
+import glob
+import os
+import recorder
+
+def load(filename):
+    """Vm and t saved by IntGen.save(filename): lists of memory maps, one
+        per file (a single one if Vm was saved in one file); quantized Vm
+        are recorder.Quantized, adaptive ones recorder.Adaptive."""
+    if os.path.exists(filename+'-Y.npy'):
+        names = [filename]
+    else:
+        names = sorted(glob.glob(filename+'-*-Y.npy'),
+                        key=lambda f: int(f[len(filename)+1:-len('-Y.npy')]))
+        names = [f[:-len('-Y.npy')] for f in names]
+    assert names, "no file " + filename + "-Y.npy"
+    return [recorder.loadvm(f+'-Y.npy') for f in names], \
+           [numpy.load(f+'-t.npy',mmap_mode='r') for f in names]
+
+def traces(Vm,coords):
+    """Time series (one row per cell) of the cells coords, Vm being an
+        array, a memory map or a list of them (consecutive in time)."""
+    if not isinstance(Vm,(list,tuple)):
+        Vm = [Vm]
+    idx = [tuple(numpy.atleast_1d(c)) for c in coords]
+    out = numpy.empty((len(idx),sum([v.shape[-1] for v in Vm])))
+    k = 0
+    for v in Vm:
+        n = v.shape[-1]
+        for i,c in enumerate(idx):
+            out[i,k:k+n] = v[c]
+        k += n
+    return out
+
+def _parabolic(c,i):
+    """Sub-sample offset of the maximum of the rows of c at the indices i
+        (parabola through the maximum and its two neighbours)."""
+    r = numpy.arange(len(i))
+    n = c.shape[1]
+    y0 = c[r,numpy.maximum(i-1,0)]
+    y1 = c[r,i]
+    y2 = c[r,numpy.minimum(i+1,n-1)]
+    den = y0-2*y1+y2
+    ok = (den < 0) & (i > 0) & (i < n-1)
+    return numpy.where(ok,0.5*(y0-y2)/numpy.where(ok,den,-1),0.)
+
+def delays(X,pairs,dt,maxlag=None):
+    """Delays of the traces pairs.
+            X : traces (one per row)
+            pairs : (npairs,2) indices of the rows, the delay is positive
+                when the second trace lags the first one
+            dt : time between two samples (ms)
+            maxlag : largest delay searched (ms), all the lags if None
+        Returns the delays (ms) and the normalized correlation at the peak.
+    """
+    pairs = numpy.asarray(pairs,int).reshape(-1,2)
+    nt = X.shape[1]
+    n = 1
+    while n < 2*nt-1:
+        n *= 2
+    X = X - X.mean(axis=1)[:,numpy.newaxis]
+    norm = numpy.sqrt((X**2).sum(axis=1))
+    F = numpy.fft.rfft(X,n,axis=1)
+    c = numpy.fft.irfft(numpy.conj(F[pairs[:,0]])*F[pairs[:,1]],n,axis=1)
+    #lags -(nt-1)..nt-1
+    c = numpy.concatenate((c[:,n-nt+1:],c[:,:nt]),axis=1)
+    lags = numpy.arange(-(nt-1),nt)
+    if maxlag is None:
+        i = numpy.argmax(c,axis=1)
+    else:
+        i = numpy.argmax(numpy.where(numpy.abs(lags)*dt > maxlag,-numpy.inf,c),
+                                                                    axis=1)
+    peak = c[numpy.arange(len(i)),i]
+    lag = lags[i] + _parabolic(c,i)
+    den = norm[pairs[:,0]]*norm[pairs[:,1]]
+    return lag*dt, peak/numpy.where(den > 0,den,1)